@@ -0,0 +1,35 @@
+""" Compare two benchmark JSON results, exits 1 on regression. """
+
+import sys
+import json
+import argparse
+
+def build_argparse():
+    """Build argument parser for command line."""
+    parser = argparse.ArgumentParser(description='compare benchmark results')
+    parser.add_argument('baseline', help='JSON result of baseline commit')
+    parser.add_argument('current', help='JSON result of current commit')
+    parser.add_argument('--threshold', dest='threshold', type=float, default=0.2,
+                        help='allowed slowdown ratio of p50 (0.2 is 20%%)')
+    return parser
+
+def main():
+    args = build_argparse().parse_args()
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    with open(args.current) as f:
+        current = json.load(f)['results']
+    regressed = False
+    for name in sorted(set(baseline.keys()) & set(current.keys())):
+        before = baseline[name]['p50']
+        after = current[name]['p50']
+        ratio = after / before if before > 0 else 1.0
+        mark = ''
+        if ratio > 1.0 + args.threshold:
+            mark = '  REGRESSION'
+            regressed = True
+        print('%-32s %10.4f ms %10.4f ms %6.2fx%s' % (name, before * 1e3, after * 1e3, ratio, mark))
+    return 1 if regressed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
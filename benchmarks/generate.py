@@ -0,0 +1,79 @@
+""" Synthetic csv manifest and image tree generator for benchmarks. """
+
+import os
+import sys
+import csv
+import random
+import argparse
+from PIL import Image, ImageDraw
+
+def build_argparse():
+    """Build argument parser for command line."""
+    parser = argparse.ArgumentParser(description='generate synthetic benchmark corpus')
+    parser.add_argument('outdir', help='output directory')
+    parser.add_argument('--rows', dest='rows', type=int, default=100000,
+                        help='number of csv rows')
+    parser.add_argument('--dirs', dest='dirs', type=int, default=100,
+                        help='number of image directories')
+    parser.add_argument('--columns', dest='columns', type=int, default=3,
+                        help='number of csv columns (first one is image file name)')
+    parser.add_argument('--labels', dest='labels', type=int, default=20,
+                        help='number of distinct values in label columns')
+    parser.add_argument('--quoted', dest='quoted', type=float, default=0.01,
+                        help='ratio of rows with quoted fields (containing comma and newline)')
+    parser.add_argument('--images-per-dir', dest='images_per_dir', type=int, default=40,
+                        help='number of image files generated in each directory')
+    parser.add_argument('--width', dest='width', type=int, default=640,
+                        help='image width')
+    parser.add_argument('--height', dest='height', type=int, default=480,
+                        help='image height')
+    parser.add_argument('--format', dest='format', choices=['jpeg', 'png'], default='jpeg',
+                        help='image file format')
+    parser.add_argument('--seed', dest='seed', type=int, default=1)
+    return parser
+
+def image_name(directory, i, fmt):
+    """ Returns relative image file name of i-th row in directory. """
+    ext = 'jpg' if fmt == 'jpeg' else 'png'
+    return 'dir%04d/img%08d.%s' % (directory, i, ext)
+
+def write_manifest(filename, args, rnd):
+    """ Write csv manifest, rows are spread over directories. """
+    counts = [0] * args.dirs
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        for i in range(args.rows):
+            directory = rnd.randrange(args.dirs)
+            row = [image_name(directory, counts[directory], args.format)]
+            counts[directory] += 1
+            for c in range(1, args.columns):
+                row.append('label%03d' % (rnd.randrange(args.labels)))
+            if args.columns > 1 and rnd.random() < args.quoted:
+                row[-1] = 'note, with comma\nand "newline"'
+            writer.writerow(row)
+    return counts
+
+def write_images(outdir, args, counts, rnd):
+    """ Write image files of first rows in each directory. """
+    for directory, count in enumerate(counts):
+        os.makedirs(os.path.join(outdir, 'dir%04d' % (directory)), exist_ok=True)
+        for i in range(min(count, args.images_per_dir)):
+            image = Image.new('RGB', (args.width, args.height),
+                              (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)))
+            draw = ImageDraw.Draw(image)
+            for k in range(8):
+                x, y = rnd.randrange(args.width), rnd.randrange(args.height)
+                draw.ellipse((x, y, x + args.width // 4, y + args.height // 4),
+                             fill=(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)))
+            image.save(os.path.join(outdir, image_name(directory, i, args.format)))
+
+def main():
+    args = build_argparse().parse_args()
+    rnd = random.Random(args.seed)
+    os.makedirs(args.outdir, exist_ok=True)
+    counts = write_manifest(os.path.join(args.outdir, 'manifest.csv'), args, rnd)
+    write_images(args.outdir, args, counts, rnd)
+    print('generated %d rows in %d directories: %s' % (args.rows, args.dirs, args.outdir), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
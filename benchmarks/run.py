@@ -0,0 +1,148 @@
+""" Headless benchmarks of csv list viewer, results are written as JSON. """
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PIL
+from csvlistmodel import ListModel
+from csvlistcache import ThumbnailCache
+from csvlistview import ListRow
+
+def build_argparse():
+    """Build argument parser for command line."""
+    parser = argparse.ArgumentParser(description='run csv list viewer benchmarks')
+    parser.add_argument('corpus', help='directory made by generate.py')
+    parser.add_argument('--output', dest='output', default=None,
+                        help='JSON result file (default: stdout)')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=5,
+                        help='repetitions of each measurement')
+    parser.add_argument('--rows', dest='display_rows', type=int, default=10,
+                        help='rows of one page')
+    parser.add_argument('--heights', dest='heights', default='40,120,0',
+                        help='row heights for get_imagerows (0 is original size)')
+    parser.add_argument('--jobs', dest='jobs', type=int, default=0,
+                        help='processes for parallel read (0 skips it)')
+    return parser
+
+def summarize(samples):
+    """ Returns statistics of timing samples in seconds. """
+    ordered = sorted(samples)
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+    return {'n': len(ordered), 'mean': sum(ordered) / len(ordered), 'min': ordered[0],
+            'p50': percentile(0.5), 'p95': percentile(0.95), 'max': ordered[-1]}
+
+def measure(repeat, func, setup=None):
+    """ Time func repeat times, setup runs before each (not timed). """
+    samples = []
+    for i in range(repeat):
+        arg = setup() if setup is not None else None
+        start = time.perf_counter()
+        func(arg)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+def git_commit():
+    """ Returns current commit id, or None. """
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                      cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def imagesize_for(model, height):
+    """ Same target size CsvListApp.get_imagesize computes for --height. """
+    if height == 0:
+        return None
+    width, image_height = model.get_imagesize()
+    if height - 2 >= image_height:
+        return None
+    ratio = (height - 2) / image_height
+    return (int(width * ratio), height - 2)
+
+def run(args):
+    csvfile = os.path.join(args.corpus, 'manifest.csv')
+    results = {}
+    model = ListModel(args.display_rows, args.corpus)
+    model.read(csvfile)
+    lines = model.linecount()
+    size = os.path.getsize(csvfile)
+
+    # ingest
+    def read(lazy, sidecar, jobs=1):
+        def inner(arg):
+            ListModel(args.display_rows, args.corpus).read(csvfile, lazy=lazy, sidecar=sidecar, jobs=jobs)
+        return inner
+    def remove_sidecar():
+        if os.path.exists(csvfile + '.idx'):
+            os.remove(csvfile + '.idx')
+    results['read.eager'] = measure(args.repeat, read(False, False))
+    results['read.lazy'] = measure(args.repeat, read(True, False))
+    results['read.lazy.sidecar_build'] = measure(args.repeat, read(True, True),
+                                                 remove_sidecar)
+    results['read.lazy.sidecar_load'] = measure(args.repeat, read(True, True))
+    if args.jobs > 1:
+        results['read.eager.jobs%d' % (args.jobs)] = measure(args.repeat, read(False, False, args.jobs))
+        results['read.lazy.jobs%d' % (args.jobs)] = measure(args.repeat, read(True, False, args.jobs))
+    for name in list(results.keys()):
+        results[name]['mb_per_s'] = size / results[name]['p50'] / 1e6
+        results[name]['rows_per_s'] = lines / results[name]['p50']
+
+    # navigation
+    path_list = model.get_path_list()
+    def change_paths(arg):
+        for path in path_list:
+            model.change_path(path)
+    results['change_path.all'] = measure(args.repeat, change_paths)
+    results['change_path.all']['paths'] = len(path_list)
+
+    # page decode, without cache and with warm cache
+    model.change_path(path_list[0])
+    for height in [int(h) for h in args.heights.split(',')]:
+        imagesize = imagesize_for(model, height)
+        model.cache = None
+        results['get_imagerows.h%d' % (height)] = measure(
+            args.repeat, lambda arg: model.get_imagerows(imagesize=imagesize))
+        model.cache = ThumbnailCache()
+        model.get_imagerows(imagesize=imagesize)
+        results['get_imagerows.h%d.cached' % (height)] = measure(
+            args.repeat, lambda arg: model.get_imagerows(imagesize=imagesize))
+        model.cache = None
+
+    # row text and ListRow construction
+    model.row_selected([str(i) for i in range(min(args.display_rows, len(model.indexes)))])
+    results['get_row_text.page'] = measure(args.repeat, lambda arg: model.get_row_text())
+    image = model.load_image(model.get_filename(model.indexes[0]), imagesize_for(model, 40))
+    texts = model.lines[model.indexes[0]]
+    def construct_rows(arg):
+        for i in range(1000):
+            ListRow(image, texts)
+    results['ListRow.x1000'] = measure(args.repeat, construct_rows)
+
+    return {'meta': {'commit': git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'python': platform.python_version(), 'pillow': PIL.__version__,
+                     'platform': platform.platform(), 'cpus': os.cpu_count(),
+                     'csv_bytes': size, 'csv_lines': lines, 'display_rows': args.display_rows,
+                     'repeat': args.repeat},
+            'results': results}
+
+def main():
+    args = build_argparse().parse_args()
+    report = run(args)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -3,23 +3,53 @@
 import sys
 import os
 import re
+import time
 import csv
 import argparse
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from csvlistview import ListView
 from csvlistmodel import ListModel
+from csvlistcache import ThumbnailCache
+from csvlistprefetch import PrefetchScheduler
+from csvlistimage import RESAMPLE_FILTERS, UNREADABLE_SIZE, fit_size
+from csvliststore import ThumbnailStore
+from csvlistprofile import PROFILER, stage
+from csvlistarchive import ArchiveSource, is_archive
+from csvlisttree import prefix_range
+from csvlistdecoder import DecodeEngine
+from csvlistshards import expand_inputs, is_compressed
+
+NAVIGATOR_PATHS = 1000  # with more image paths, auto navigator is directory tree
+MAX_PREFIX_MATCHES = 1000   # paths listed in navigator for path prefix
 
 class CsvListApp:
     def __init__(self):
         """Constructor of this class, with minimum initialization."""
         self.imagesize = None
         self.imagesize_set = None
+        self.prefetcher = None
+        self.decoder = None
+        self.visible_jobs = []
+        self.placeholder_size = None
+        self.store = None
+        self.source = None
+        self.engine = None
+        self.virtual = False
+        self.virtual_epoch = 0
+        self.view = None
+        self.profile = False
+        self.follow_interval = None
+        self.navigator = 'combo'
+        self.profile_trace = None
 
     def build_argparse(self):
         """Build argument parser for command line."""
         parser = argparse.ArgumentParser(description='csv list viewer')
-        parser.add_argument('csvfile') # required=True is not required here.
+        parser.add_argument('csvfile', nargs='+',
+                            help='csv file, or shard files(glob pattern, .gz/.bz2/.xz/.zst) read as one')
         parser.add_argument('--imagedir', nargs='?', dest='image_directory',
-                            required=False, help='base of image file directory',
+                            required=False, help='base of image file directory, or zip/tar archive',
                             metavar='./', default='./')
         parser.add_argument('--rows', nargs='?', dest='display_rows',
                             required=False, help='number of rows to be displayed',
@@ -33,16 +63,82 @@ class CsvListApp:
         parser.add_argument('--columns', nargs='?', dest='columns',required=False,
                             help='string list of column names for list',
                             metavar='filename,label,evaluated', default=None)
+        parser.add_argument('--cache-mb', nargs='?', dest='cache_mb',
+                            required=False, help='memory budget of thumbnail cache in MB (0 disables)',
+                            type=int, metavar='256', default='256')
+        parser.add_argument('--prefetch-forward', nargs='?', dest='prefetch_forward',
+                            required=False, help='number of next pages decoded in background',
+                            type=int, metavar='2', default='2')
+        parser.add_argument('--prefetch-backward', nargs='?', dest='prefetch_backward',
+                            required=False, help='number of previous pages decoded in background',
+                            type=int, metavar='1', default='1')
+        parser.add_argument('--prefetch-workers', nargs='?', dest='prefetch_workers',
+                            required=False, help='number of background decode threads (0 disables)',
+                            type=int, metavar='2', default='2')
+        parser.add_argument('--resample', nargs='?', dest='resample',
+                            required=False, help='resample filter to shrink images',
+                            choices=sorted(RESAMPLE_FILTERS.keys()), default='bicubic')
+        parser.add_argument('--reducing-gap', nargs='?', dest='reducing_gap',
+                            required=False, help='reduced-resolution decode factor (0 decodes at full resolution)',
+                            type=float, metavar='2.0', default='2.0')
+        parser.add_argument('--max-image-mb', nargs='?', dest='max_image_mb',
+                            required=False, help='memory ceiling of one decoded image in MB (0 disables)',
+                            type=int, metavar='64', default='64')
+        parser.add_argument('--thumb-store', nargs='?', dest='thumb_store',
+                            required=False, help='directory of persistent thumbnail store',
+                            metavar='./thumbs', default=None)
+        parser.add_argument('--thumb-store-mb', nargs='?', dest='thumb_store_mb',
+                            required=False, help='size cap of persistent thumbnail store in MB',
+                            type=int, metavar='1024', default='1024')
+        parser.add_argument('--decode-workers', nargs='?', dest='decode_workers',
+                            required=False, help='number of processes to decode images, requires python 3.8 and later (0 decodes in this process)',
+                            type=int, metavar='0', default='0')
+        parser.add_argument('--probe-workers', nargs='?', dest='probe_workers',
+                            required=False, help='number of threads to read image sizes of all rows (0 reads first image only)',
+                            type=int, metavar='0', default='0')
+        parser.add_argument('--jobs', nargs='?', dest='jobs',
+                            required=False, help='number of processes to parse csv file',
+                            type=int, metavar='1', default='1')
+        parser.add_argument('--lazy', dest='lazy', action='store_true',
+                            required=False, help='index csv file by offsets and parse rows on demand')
+        parser.add_argument('--no-index', dest='sidecar', action='store_false',
+                            required=False, help='do not read/write sidecar index file(<csv>.idx) with --lazy')
+        parser.add_argument('--virtual', dest='virtual', action='store_true',
+                            required=False, help='scroll through all rows instead of paging')
+        parser.add_argument('--progressive', dest='progressive', action='store_true',
+                            required=False, help='show texts first, then images as they are decoded')
+        parser.add_argument('--navigator', nargs='?', dest='navigator',
+                            required=False, help='image path selector (auto: tree for many paths)',
+                            choices=['auto', 'combo', 'tree'], default='auto')
+        parser.add_argument('--follow', dest='follow', action='store_true',
+                            required=False, help='keep reading rows appended to csv file')
+        parser.add_argument('--follow-interval', nargs='?', dest='follow_interval',
+                            required=False, help='interval to check appended rows in milliseconds',
+                            type=int, metavar='1000', default='1000')
+        parser.add_argument('--pregenerate', dest='pregenerate', action='store_true',
+                            required=False, help='store thumbnails of all rows into --thumb-store without window')
+        parser.add_argument('--profile', dest='profile', action='store_true',
+                            required=False, help='print latency of each stage and page flip at exit')
+        parser.add_argument('--profile-trace', nargs='?', dest='profile_trace',
+                            required=False, help='write trace of stages at exit (implies --profile)',
+                            metavar='trace.json', default=None)
         return parser
 
     def check_argument(self, args):
         """Checks provided arguments."""
         # imagedir
+        self.image_directory = args.image_directory
         if args.image_directory is not None:
-            if not os.path.isdir(args.image_directory):
+            if is_archive(args.image_directory):
+                try:
+                    self.source = ArchiveSource(args.image_directory)
+                except (OSError, ValueError) as e:
+                    print('unable to open archive: %s (%s)' % (args.image_directory, e), file=sys.stderr)
+                    return False
+                self.image_directory = None
+            elif not os.path.isdir(args.image_directory):
                 print('Is not a directory: %s' % (args.image_directory), file=sys.stderr)
                 return False
-        self.image_directory = args.image_directory
 
         # rows
         if args.display_rows < 3 or args.display_rows > 20:
@@ -79,15 +175,105 @@ class CsvListApp:
                 return False
             self.row_height = args.row_height
 
-        # filename
-        if os.path.isfile(args.csvfile) is None: # checked by argparse, so
-            print('csvfile is not specified', file=sys.stderr)
+        # cache-mb
+        if args.cache_mb < 0:
+            print('out of range(cache size must not be negative): %d' % (args.cache_mb), file=sys.stderr)
+            return False
+        self.cache = None
+        if args.cache_mb > 0:
+            self.cache = ThumbnailCache(args.cache_mb * 1024 * 1024)
+
+        # prefetch
+        if args.prefetch_forward < 0 or args.prefetch_backward < 0 or args.prefetch_workers < 0:
+            print('out of range(prefetch options must not be negative)', file=sys.stderr)
+            return False
+        self.prefetch_forward = args.prefetch_forward
+        self.prefetch_backward = args.prefetch_backward
+        self.prefetch_workers = args.prefetch_workers
+        self.progressive = args.progressive
+        self.virtual = args.virtual
+
+        # resample, reducing-gap
+        self.resample = args.resample
+        self.reducing_gap = None
+        if args.reducing_gap != 0:
+            if args.reducing_gap < 1.0:
+                print('out of range(reducing gap must be 0 or 1.0 and more): %s' % (args.reducing_gap), file=sys.stderr)
+                return False
+            self.reducing_gap = args.reducing_gap
+
+        # max-image-mb
+        if args.max_image_mb < 0:
+            print('out of range(image memory ceiling must not be negative): %d' % (args.max_image_mb), file=sys.stderr)
+            return False
+        self.max_image_bytes = None
+        if args.max_image_mb > 0:
+            self.max_image_bytes = args.max_image_mb * 1024 * 1024
+
+        # thumb-store
+        if args.thumb_store is not None:
+            if args.thumb_store_mb <= 0:
+                print('out of range(thumbnail store size must be positive): %d' % (args.thumb_store_mb), file=sys.stderr)
+                return False
+            try:
+                self.store = ThumbnailStore(args.thumb_store, args.thumb_store_mb * 1024 * 1024)
+            except (OSError, sqlite3.Error) as e:
+                print('unable to open thumbnail store: %s (%s)' % (args.thumb_store, e), file=sys.stderr)
+                return False
+
+        # pregenerate
+        self.pregenerating = args.pregenerate
+        if args.pregenerate and (args.thumb_store is None or args.row_height is None):
+            print('--pregenerate requires --thumb-store and --height', file=sys.stderr)
+            return False
+
+        # jobs
+        if args.jobs < 1:
+            print('out of range(jobs must be 1 and more): %d' % (args.jobs), file=sys.stderr)
+            return False
+
+        # probe-workers
+        if args.probe_workers < 0:
+            print('out of range(probe workers must not be negative): %d' % (args.probe_workers), file=sys.stderr)
+            return False
+
+        # decode-workers
+        if args.decode_workers < 0:
+            print('out of range(decode workers must not be negative): %d' % (args.decode_workers), file=sys.stderr)
+            return False
+
+        # follow
+        if args.follow:
+            if args.follow_interval < 100:
+                print('out of range(follow interval must be 100 and more): %d' % (args.follow_interval), file=sys.stderr)
+                return False
+            self.follow_interval = args.follow_interval
+
+        # profile, enabled before reading csv file to measure it.
+        self.profile = args.profile or args.profile_trace is not None
+        self.profile_trace = args.profile_trace
+        if self.profile:
+            PROFILER.enable(trace=self.profile_trace is not None)
+
+        # filename, or shard files given by list or glob pattern.
+        csvfiles = expand_inputs(args.csvfile)
+        csvfile = csvfiles
+        csvname = '%s and %d more' % (csvfiles[0], len(csvfiles) - 1)
+        if len(csvfiles) == 1 and not is_compressed(csvfiles[0]):
+            csvfile = csvname = csvfiles[0]
+        elif args.lazy or args.follow:
+            print('--lazy and --follow require one uncompressed csv file', file=sys.stderr)
             return False
-        self.model = ListModel(self.display_rows, self.image_directory)
-        self.model.read(args.csvfile)
+        self.model = ListModel(self.display_rows, self.image_directory, self.cache,
+                               self.resample, self.reducing_gap, self.store, self.source,
+                               max_image_bytes=self.max_image_bytes)
+        self.model.read(csvfile, lazy=args.lazy, sidecar=args.sidecar, jobs=args.jobs,
+                        follow=args.follow)
         if self.model.linecount() <= 0:
-            print('csv file does not have lines: %s' % (args.csvfile))
+            print('csv file does not have lines: %s' % (csvname))
             return False
+        if args.probe_workers > 0:
+            self.model.probe_images(args.probe_workers)
 
         # columns - checks corresponding between csvfile and co
         self.columns = None
@@ -102,9 +288,43 @@ class CsvListApp:
                 return False
             columns_list = args.columns.split(',')
             if len(columns_list) != self.model.columns():
-                print('columns does not match with file: %s / %s' % (args.columns, args.csvfile))
+                print('columns does not match with file: %s / %s' % (args.columns, csvname))
                 return False
             self.columns = columns_list
+
+        # navigator
+        self.navigator = args.navigator
+        if self.navigator == 'auto':
+            if len(self.model.get_path_list()) > NAVIGATOR_PATHS:
+                self.navigator = 'tree'
+            else:
+                self.navigator = 'combo'
+
+        # decode engine, its slots are sized for thumbnails of --height.
+        threads = self.prefetch_workers
+        if args.decode_workers > 0:
+            imagesize = self.get_imagesize()
+            if imagesize is None:
+                print('decode workers require --height to shrink images, decoding in this process', file=sys.stderr)
+            else:
+                try:
+                    self.engine = DecodeEngine(args.decode_workers, imagesize, self.resample,
+                                               self.reducing_gap, args.image_directory if self.source else None,
+                                               self.max_image_bytes)
+                except OSError as e:
+                    print('unable to start decode workers: %s' % (e), file=sys.stderr)
+                    return False
+                self.model.engine = self.engine
+                # threads only wait for worker processes, so one for each of them.
+                if threads > 0:
+                    threads = max(threads, args.decode_workers)
+
+        # prefetch requires thumbnail cache to keep decoded images.
+        if self.cache is not None and threads > 0:
+            self.prefetcher = PrefetchScheduler(self.model, self.prefetch_forward,
+                                                self.prefetch_backward, threads)
+        if self.progressive or self.virtual:
+            self.decoder = ThreadPoolExecutor(max_workers=max(1, threads))
         # all arguments were checked.
         return True
 
@@ -119,7 +339,13 @@ class CsvListApp:
     def get_imagesize(self):
         """Retrieve image-size from argument or actual image file."""
         if self.imagesize_set is None:
-            if self.row_height is not None:
+            summary = self.model.get_size_summary()
+            if self.row_height is not None and summary is not None:
+                # images keep their aspect ratio, box is wide enough for 95% of them.
+                if self.row_height - 2 < summary['height'][2]: # must be shrinked
+                    width = int(summary['aspect'][2] * (self.row_height - 2))
+                    self.imagesize = (max(1, width), self.row_height - 2)
+            elif self.row_height is not None and self.model.get_imagesize() is not None:
                 # get shrink ratio using row_height and real image height.
                 width, height = self.model.get_imagesize()
                 if self.row_height - 2 < height: # must be shrinked
@@ -133,7 +359,7 @@ class CsvListApp:
         imagesize = self.get_imagesize()
         width = 0
         if imagesize is None:
-            width, height = self.model.get_imagesize()
+            width, height = self.get_display_extent()
         else:
             width = imagesize[0]
         retval = int(width + width/10)
@@ -144,63 +370,385 @@ class CsvListApp:
     def get_rowheight(self):
         """Retrieve row-height in displayed list(Treeview)."""
         if self.row_height is None:
-            width, height = self.model.get_imagesize()
+            width, height = self.get_display_extent()
             if height > 38:
                 self.row_height = height+2
             else:
                 self.row_height = 40
         return self.row_height
 
+    def get_display_extent(self):
+        """Retrieve size images are shown at without --height, for 95% of them if sizes were probed."""
+        summary = self.model.get_size_summary()
+        if summary is None:
+            size = self.model.get_display_size()
+            return size if size is not None else UNREADABLE_SIZE
+        # bands are not probed, so as RGB.
+        return fit_size((summary['width'][1], summary['height'][1]), 3, self.max_image_bytes)
+
+    def is_virtual(self):
+        """Returns True to scroll through all rows instead of paging."""
+        return self.virtual
+
+    def get_navigator(self):
+        """Returns 'tree' for directory tree, or 'combo' for combo-box of image paths."""
+        return self.navigator
+
     def get_columns(self):
         """Returns column names if those were provied in command line."""
         return self.columns     # could be None
 
     def launch(self):
-        """Application launch code."""
+        """Application launch code, returns exit status."""
         # get argparser instance
         parser = self.build_argparse()
         # parse arguments
         args = parser.parse_args()
         # check each argument
         if not self.check_argument(args):
-            return False
+            return 1
         if self.model is None:
-            return False
+            return 1
+        if self.pregenerating:
+            status = self.pregenerate()
+            self.close_resources()
+            return status
         path_list = self.model.get_path_list()
         if path_list is None:
-            return False
+            return 1
         elif len(path_list) == 0:
-            return False
+            return 1
         # launch application with view
         self.view = ListView(self, titletext='csvlistapp')
-        self.view.fill_combobox(path_list)
+        if self.navigator == 'tree':
+            self.view.fill_navigator(self.model.get_trie())
+        else:
+            self.view.fill_combobox(path_list)
         self.model.change_path(path_list[0])
-        self.view.fill_treeview(self.model.get_imagerows(imagesize=self.get_imagesize()))
-        self.view.set_status_label(self.model.get_path_info())
+        self.show_page()
+        if self.follow_interval is not None:
+            self.view.after(self.follow_interval, self.follow_file)
         self.view.mainloop()
+        self.close_resources()
+        return 0
+
+    def pregenerate(self):
+        """Store thumbnails of all rows into thumbnail store, without window.
+           stored thumbnails are skipped, so interrupted run can be resumed.
+           returns exit status, 1 if any image failed or none is readable, 130 if interrupted."""
+        model = self.model
+        model.cache = None      # thumbnails go to store only
+        imagesize = self.get_imagesize()
+        if imagesize is None:
+            if self.model.get_imagesize() is None:
+                print('no readable image file is found, nothing to store', file=sys.stderr)
+                return 1
+            print('images are not larger than --height, nothing to store', file=sys.stderr)
+            return 0
+        filenames = []
+        seen = set()
+        for path in model.get_path_list():
+            for index in model.path_indexes[path]:
+                filename = model.get_filename(index)
+                if filename not in seen:
+                    seen.add(filename)
+                    filenames.append(filename)
+        seen = None
+        if self.engine is not None:
+            threads = len(self.engine.workers)
+        else:
+            threads = os.cpu_count() or 1
+        counts = {'stored': 0, 'exists': 0, 'missing': 0, 'failed': 0}
+        start = time.perf_counter()
+        last_report = start
+        pending = set()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            try:
+                for i in range(len(filenames) + 1):
+                    # keep a few jobs for each thread in flight.
+                    while len(pending) >= threads * 4 or (i == len(filenames) and len(pending) > 0):
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            counts[future.result()] += 1
+                        now = time.perf_counter()
+                        if now - last_report >= 1.0:
+                            last_report = now
+                            self.report_pregenerate(counts, len(filenames), now - start)
+                    if i < len(filenames):
+                        pending.add(executor.submit(self.pregenerate_one, filenames[i], imagesize))
+            except KeyboardInterrupt:
+                for future in pending:
+                    future.cancel()
+                print('\ninterrupted, run again to resume', file=sys.stderr)
+                return 130
+        self.report_pregenerate(counts, len(filenames), time.perf_counter() - start)
+        print('', file=sys.stderr)
+        evictions = self.store.get_stats()['evictions']
+        if evictions > 0:
+            print('%d shards were evicted, enlarge --thumb-store-mb to keep all thumbnails' % (evictions),
+                  file=sys.stderr)
+        return 1 if counts['failed'] > 0 else 0
+
+    def pregenerate_one(self, filename, imagesize):
+        """Worker side: store thumbnail of one image, returns stored, exists, missing or failed."""
+        variant = (self.model.resample, self.model.reducing_gap)
+        key = self.store.make_key(filename, imagesize, variant, self.model.source)
+        if key is None:
+            return 'missing'
+        if self.store.contains(key):
+            return 'exists'
+        try:
+            self.model.load_image(filename, imagesize)
+        except Exception as e:
+            print('\nunable to store thumbnail: %s (%s)' % (filename, e), file=sys.stderr)
+            return 'failed'
+        return 'stored'
+
+    def report_pregenerate(self, counts, total, elapsed):
+        """Print progress line of pregenerate."""
+        done = sum(counts.values())
+        rate = counts['stored'] / elapsed if elapsed > 0 else 0.0
+        print('\r%d/%d images: stored %d, already stored %d, missing %d, failed %d (%.1f images/s)'
+              % (done, total, counts['stored'], counts['exists'], counts['missing'], counts['failed'], rate),
+              end='', file=sys.stderr, flush=True)
+
+    def close_resources(self):
+        """Stop background workers and close stores, then report profile."""
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown()
+        if self.decoder is not None:
+            self.decoder.shutdown(wait=False)
+        if self.engine is not None:
+            self.engine.shutdown()
+        if self.store is not None:
+            self.store.close()
+        if self.source is not None:
+            self.source.close()
+        if self.profile:
+            self.report_profile()
+
+    def report_profile(self):
+        """Print stage latencies and counters, then write trace file if requested."""
+        counters = {}
+        if self.cache is not None:
+            counters['cache'] = self.cache.get_stats()
+        if self.store is not None:
+            counters['store'] = self.store.get_stats()
+        if self.prefetcher is not None:
+            counters['prefetch'] = self.prefetcher.get_stats()
+        if self.engine is not None:
+            counters['engine'] = self.engine.get_stats()
+        PROFILER.report(counters)
+        if self.profile_trace is not None:
+            try:
+                PROFILER.write_trace(self.profile_trace)
+            except OSError as e:
+                print('unable to write trace: %s (%s)' % (self.profile_trace, e), file=sys.stderr)
+
+    def follow_file(self):
+        """Read rows appended to csv file, then update view only if it was changed."""
+        model = self.model
+        result = model.refresh()
+        if result is None:
+            self.view.set_status_label('csv file was truncated or replaced, not followed any more')
+            return
+        count, new_paths, position = result
+        if self.navigator == 'tree':
+            if count > 0:
+                self.view.update_navigator(new_paths)
+        elif len(new_paths) > 0:
+            self.view.update_combobox(model.get_path_list())
+        if position is not None:
+            if position < model.get_position() + model.display_rows:
+                # new rows are inserted into(or appended to) current page, or before it.
+                self.show_page()
+            else:
+                if self.virtual:
+                    self.view.set_virtual_total(len(model.indexes))
+                self.view.set_status_label(model.get_path_info())
+        self.view.after(self.follow_interval, self.follow_file)
+
+    def get_placeholder_size(self):
+        """Retrieve size of placeholder image shown until actual image is decoded."""
+        if self.placeholder_size is None:
+            self.placeholder_size = self.get_imagesize()
+            if self.placeholder_size is None:
+                self.placeholder_size = self.get_display_extent()
+        return self.placeholder_size
+
+    def show_page(self):
+        """Fill view with current page of model, then prefetch around it."""
+        with stage('page'):
+            self.fill_page()
+
+    def fill_page(self):
+        """Fill view by the way selected with arguments."""
+        imagesize = self.get_imagesize()
+        if self.virtual:
+            self.show_window(imagesize)
+        elif self.progressive:
+            self.show_page_progressive(imagesize)
+        else:
+            if self.prefetcher is not None:
+                with stage('wait'):
+                    self.prefetcher.wait_page(imagesize)
+            # previous page is released before decoding next one, not to keep both.
+            self.view.clear_treeview()
+            self.view.fill_treeview(self.model.get_imagerows(imagesize=imagesize))
+        self.view.set_status_label(self.model.get_path_info())
+        if self.prefetcher is not None:
+            self.prefetcher.schedule(imagesize)
+
+    def show_page_progressive(self, imagesize):
+        """Fill view with texts at once, then images are decoded off-thread."""
+        for future in self.visible_jobs:
+            future.cancel()
+        self.visible_jobs = []
+        rows = self.model.get_pagerows()
+        if rows is None:
+            rows = []
+        generation = self.view.fill_treeview_progressive(rows, self.get_placeholder_size())
+        for i, row in enumerate(rows):
+            future = self.decoder.submit(self.load_visible_image, generation, i, row.filename, imagesize)
+            self.visible_jobs.append(future)
+        if self.visible_jobs:
+            self.view.start_polling()
+
+    def show_window(self, imagesize):
+        """Fill recycled items of virtual list from current position."""
+        if self.view.virtual_rows == 0:
+            return      # treeview is not mapped yet
+        for future in self.visible_jobs:
+            future.cancel()
+        self.visible_jobs = []
+        top = self.model.get_position()
+        rows = self.model.get_pagerows()
+        if rows is None:
+            rows = []
+        missing = []
+        for i, row in enumerate(rows):
+            row.image = self.model.cached_image(row.filename, imagesize)
+            if row.image is None:
+                missing.append(i)
+        total = len(self.model.indexes) if self.model.indexes is not None else 0
+        self.view.fill_virtual(top, total, rows, self.get_placeholder_size(), self.virtual_epoch)
+        for i in missing:
+            future = self.decoder.submit(self.load_visible_image, self.virtual_epoch,
+                                         top + i, rows[i].filename, imagesize)
+            self.visible_jobs.append(future)
+        if self.visible_jobs:
+            self.view.start_polling()
+
+    def virtual_resized(self, rows):
+        """Callback method to have treeview resized in virtual list."""
+        # a few more rows than visible, for partially shown bottom row.
+        self.model.display_rows = rows + 2
+        if self.model.selected_path is not None:
+            self.show_page()
+
+    def virtual_scrolled(self, top):
+        """Callback method to have virtual list scrolled."""
+        self.model.set_position(top)
+        self.show_page()
+
+    def images_pending(self):
+        """Returns True while any decode job of displayed rows is not finished."""
+        return any(not future.done() for future in self.visible_jobs)
+
+    def load_visible_image(self, generation, i, filename, imagesize):
+        """Worker side: decode image of displayed row, then post it to view."""
+        image = None
+        try:
+            if self.prefetcher is not None:
+                self.prefetcher.wait_file(filename, imagesize)
+            image = self.model.load_image(filename, imagesize)
+        except Exception as e:
+            print(e, file=sys.stderr)
+        self.view.post_image(generation, i, image)
+
+    def reset_page(self):
+        """Show selection of model changed by user from its top, jobs of previous page are dropped."""
+        if self.prefetcher is not None:
+            self.prefetcher.cancel()
+        if self.engine is not None:
+            self.engine.cancel()
+        self.virtual_epoch += 1
+        self.model.set_position(0)
+        self.show_page()
 
     def combo_selected(self, combobox):
         """Callback method to have combo-box selection event."""
         def inner(event):
             nonlocal self
             self.model.change_path(combobox.get())
-            self.view.fill_treeview(self.model.get_imagerows(imagesize=self.get_imagesize()))
-            self.view.set_status_label(self.model.get_path_info())
+            self.reset_page()
+        return inner
+
+    def navigator_selected(self, path):
+        """Callback method to have directory selected in navigator."""
+        # item of top directory('./') is rows of files there, not whole tree.
+        self.model.change_path(path, subtree=(path != ''))
+        self.reset_page()
+
+    def prefix_entered(self, entry):
+        """Callback method to have path prefix entry Return key event."""
+        def inner(event):
+            nonlocal self
+            prefix = entry.get()
+            path_list = self.model.get_path_list()
+            if prefix == '':
+                self.view.fill_navigator(self.model.get_trie())
+                return
+            start, end = prefix_range(path_list, prefix)
+            if start == end:
+                self.view.set_status_label('no image path starts with: %s' % (prefix))
+                return
+            self.view.show_navigator_matches(path_list[start:min(end, start + MAX_PREFIX_MATCHES)],
+                                             end - start)
+            self.model.change_prefix(prefix)
+            self.reset_page()
+        return inner
+
+    def query_entered(self, entry):
+        """Callback method to have query entry Return key event."""
+        def inner(event):
+            nonlocal self
+            try:
+                self.model.set_query(entry.get(), self.columns)
+            except ValueError as e:
+                self.view.set_status_label(str(e))
+                return
+            self.reset_page()
+        return inner
+
+    def heading_clicked(self, column):
+        """Callback method to have treeview heading clicked: ascending, descending, then file order."""
+        def inner():
+            nonlocal self
+            model = self.model
+            if model.sort_column != column:
+                model.set_sort(column)
+            elif not model.sort_descending:
+                model.set_sort(column, descending=True)
+            else:
+                model.set_sort(None)
+            self.view.set_sort_indicator(model.sort_column, model.sort_descending)
+            if model.selected_path is None:
+                return
+            self.reset_page()
         return inner
 
     def backward_cmd_pressed(self):
         """Callback method to have backward-command pressed event."""
         if self.model.backward():
-            self.view.fill_treeview(self.model.get_imagerows(imagesize=self.get_imagesize()))
-            self.view.set_status_label(self.model.get_path_info())
+            self.show_page()
         else:
             pass
 
     def forward_cmd_pressed(self):
         """Callback method to have forward-command pressed event."""
         if self.model.forward():
-            self.view.fill_treeview(self.model.get_imagerows(imagesize=self.get_imagesize()))
-            self.view.set_status_label(self.model.get_path_info())
+            self.show_page()
         else:
             pass
 
@@ -220,4 +768,4 @@ class CsvListApp:
 
 if __name__ == '__main__':
     app = CsvListApp()
-    app.launch()
+    sys.exit(app.launch())
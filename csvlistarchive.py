@@ -0,0 +1,316 @@
+""" Archive image source for csv file viewer application.
+
+--imagedir could be zip or (uncompressed) tar archive instead of directory.
+Member directory of archive is scanned once, and kept in sidecar file
+(<archive>.idx) which is validated by size and mtime of the archive.
+Members are read in place from memory-mapped archive: stored(uncompressed)
+members through a file object over the mapping without copying whole
+member, deflated members by one zlib call. Other compression methods are
+read by zipfile/tarfile, with one archive handle for each thread.
+
+layout of sidecar (little-endian):
+    header      magic, version, kind, archive size, archive mtime,
+                number of members, length of names
+    names       JSON list of member names, then 8-byte aligned arrays of
+                offsets(Q), compressed sizes(Q), sizes(Q), methods(B)
+"""
+
+import io
+import os
+import sys
+import mmap
+import json
+import zlib
+import errno
+import struct
+import tarfile
+import zipfile
+import threading
+import posixpath
+from array import array
+
+MAGIC = b'CSVLARC\0'
+VERSION = 1
+HEADER = struct.Struct('<8sII QqQQ')
+LOCAL_HEADER = struct.Struct('<4s5H3L2H')   # zip local file header
+LOCAL_SIGNATURE = b'PK\003\004'
+KIND_ZIP = 1
+KIND_TAR = 2
+STORED = 0          # member data is stored as is (zip stored, or tar)
+DEFLATED = 8        # zip deflated
+OTHER = 255         # read by zipfile/tarfile (other compression, encrypted, sparse)
+
+def sidecar_name(filename):
+    """ Returns sidecar file name of archive. """
+    return filename + '.idx'
+
+def is_archive(filename):
+    """ Returns True if filename is zip or tar archive file. """
+    if not os.path.isfile(filename):
+        return False
+    return zipfile.is_zipfile(filename) or tarfile.is_tarfile(filename)
+
+def normalize(name):
+    """ Returns member name of relative path in csv file (i.e. ./star/a.jpg -> star/a.jpg). """
+    return posixpath.normpath(name.replace('\\', '/')).lstrip('/')
+
+def align(position):
+    """ Returns position rounded up to 8 bytes. """
+    return (position + 7) & ~7
+
+class MemberReader:
+    """ Read-only file object of member in memory-mapped archive. """
+    def __init__(self, buf, start, size, name=None):
+        self.buf = buf
+        self.start = start
+        self.size = size
+        self.pos = 0
+        self.name = name
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            end = self.size
+        else:
+            end = min(self.size, self.pos + size)
+        if end <= self.pos:
+            return b''
+        data = self.buf[self.start + self.pos:self.start + end]
+        self.pos = end
+        return data
+
+    def readline(self, size=-1):
+        end = self.size
+        if size is not None and size >= 0:
+            end = min(end, self.pos + size)
+        found = self.buf.find(b'\n', self.start + self.pos, self.start + end)
+        if found >= 0:
+            end = found - self.start + 1
+        return self.read(end - self.pos)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError('negative seek position %d' % (offset))
+        self.pos = offset
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+class ArchiveSource:
+    def __init__(self, filename, sidecar=True, readonly=False):
+        """ Open archive and index its members, raises OSError or ValueError.
+            with readonly, sidecar is used if it is valid but never written. """
+        self.filename = filename
+        self.path = os.path.realpath(filename)
+        with open(filename, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if st.st_size == 0:
+                raise ValueError('empty archive: %s' % (filename))
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = st.st_size
+        self.mtime = st.st_mtime_ns
+        self.kind = None
+        self.names = None       # member names as they are in archive
+        self.offsets = None     # zip: local header offset, tar: data offset
+        self.csizes = None
+        self.sizes = None
+        self.methods = None
+        self.index_buf = None   # mapping of sidecar, arrays are views of it
+        self.data_offsets = {}  # zip member -> data offset after local header
+        self.handles = threading.local()    # archive handle of each thread
+        self.handle_list = []
+        self.lock = threading.Lock()
+        if not (sidecar and self.read_members()):
+            self.scan_members()
+            if sidecar and not readonly:
+                self.write_members()
+        self.lookup = {}
+        for i, name in enumerate(self.names):
+            self.lookup[normalize(name)] = i
+
+    def scan_members(self):
+        """ Read member directory from archive. """
+        self.offsets = array('Q')
+        self.csizes = array('Q')
+        self.sizes = array('Q')
+        self.methods = array('B')
+        self.names = []
+        if zipfile.is_zipfile(self.filename):
+            self.kind = KIND_ZIP
+            try:
+                with zipfile.ZipFile(self.filename) as archive:
+                    infos = archive.infolist()
+            except zipfile.BadZipFile as e:
+                raise ValueError('invalid zip archive: %s (%s)' % (self.filename, e))
+            for info in infos:
+                if info.filename.endswith('/'):
+                    continue    # directory
+                method = info.compress_type
+                if info.flag_bits & 0x1 or method not in (STORED, DEFLATED):
+                    method = OTHER
+                self.names.append(info.filename)
+                self.offsets.append(info.header_offset)
+                self.csizes.append(info.compress_size)
+                self.sizes.append(info.file_size)
+                self.methods.append(method)
+            return
+        self.kind = KIND_TAR
+        try:
+            # only uncompressed tar can be read in place.
+            with tarfile.open(self.filename, 'r:') as archive:
+                for member in archive:
+                    if not member.isfile():
+                        continue
+                    self.names.append(member.name)
+                    self.offsets.append(member.offset_data)
+                    self.csizes.append(member.size)
+                    self.sizes.append(member.size)
+                    self.methods.append(OTHER if member.issparse() else STORED)
+        except tarfile.ReadError as e:
+            raise ValueError('unsupported archive (zip or uncompressed tar is required): %s (%s)'
+                             % (self.filename, e))
+
+    def read_members(self):
+        """ Load member directory from sidecar, returns False if it is missing or stale. """
+        try:
+            with open(sidecar_name(self.filename), 'rb') as f:
+                idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        if len(idx) < HEADER.size:
+            return False
+        magic, version, kind, size, mtime, count, names_length = HEADER.unpack_from(idx, 0)
+        if magic != MAGIC or version != VERSION or size != self.size or mtime != self.mtime:
+            return False
+        position = HEADER.size + names_length
+        if len(idx) < align(position) + count * 25:
+            return False
+        view = memoryview(idx)
+        self.names = json.loads(bytes(view[HEADER.size:position]).decode('utf-8'))
+        arrays = []
+        position = align(position)
+        for typecode, itemsize in (('Q', 8), ('Q', 8), ('Q', 8), ('B', 1)):
+            arrays.append(view[position:position + count * itemsize].cast(typecode))
+            position += count * itemsize
+        self.offsets, self.csizes, self.sizes, self.methods = arrays
+        self.kind = kind
+        self.index_buf = idx
+        return True
+
+    def write_members(self):
+        """ Write member directory to sidecar, returns False on error. """
+        names = json.dumps(self.names).encode('utf-8')
+        header = HEADER.pack(MAGIC, VERSION, self.kind, self.size, self.mtime,
+                             len(self.names), len(names))
+        tmpname = sidecar_name(self.filename) + '.tmp'
+        try:
+            with open(tmpname, 'wb') as f:
+                f.write(header)
+                f.write(names)
+                f.write(b'\0' * (align(f.tell()) - f.tell()))
+                for values in (self.offsets, self.csizes, self.sizes, self.methods):
+                    f.write(values.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmpname, sidecar_name(self.filename))
+        except OSError as e:
+            print('unable to write index file: %s (%s)' % (sidecar_name(self.filename), e), file=sys.stderr)
+            return False
+        return True
+
+    def __len__(self):
+        return len(self.names)
+
+    def exists(self, name):
+        """ Returns True if archive has member name(normalized). """
+        return name in self.lookup
+
+    def stat(self, name):
+        """ Returns (path, size, mtime) to identify member, or None if it does not exist. """
+        i = self.lookup.get(name)
+        if i is None:
+            return None
+        return ('%s!/%s' % (self.path, name), self.sizes[i], self.mtime)
+
+    def data_offset(self, i):
+        """ Returns offset of member data in archive. """
+        if self.kind == KIND_TAR:
+            return self.offsets[i]
+        offset = self.data_offsets.get(i)
+        if offset is None:
+            header_offset = self.offsets[i]
+            fields = LOCAL_HEADER.unpack_from(self.buf, header_offset)
+            if fields[0] != LOCAL_SIGNATURE:
+                raise OSError(errno.EIO, 'bad local header of member', self.names[i])
+            # name and extra field of local header could differ from central directory.
+            offset = header_offset + LOCAL_HEADER.size + fields[9] + fields[10]
+            self.data_offsets[i] = offset
+        return offset
+
+    def open(self, name):
+        """ Returns file object of member name(normalized), raises OSError if it does not exist. """
+        i = self.lookup.get(name)
+        if i is None:
+            raise FileNotFoundError(errno.ENOENT, 'no such member in archive',
+                                    '%s!/%s' % (self.filename, name))
+        method = self.methods[i]
+        if method == STORED:
+            return MemberReader(self.buf, self.data_offset(i), self.sizes[i], name)
+        if method == DEFLATED:
+            start = self.data_offset(i)
+            try:
+                data = zlib.decompress(self.buf[start:start + self.csizes[i]], -15)
+            except zlib.error as e:
+                raise OSError(errno.EIO, 'unable to inflate member (%s)' % (e), name)
+            return io.BytesIO(data)
+        return io.BytesIO(self.read_member(self.names[i]))
+
+    def read_member(self, member):
+        """ Read member by zipfile/tarfile, through archive handle of this thread. """
+        archive = getattr(self.handles, 'archive', None)
+        if archive is None:
+            if self.kind == KIND_ZIP:
+                archive = zipfile.ZipFile(self.filename)
+            else:
+                archive = tarfile.open(self.filename, 'r:')
+            self.handles.archive = archive
+            with self.lock:
+                self.handle_list.append(archive)
+        try:
+            if self.kind == KIND_ZIP:
+                return archive.read(member)
+            return archive.extractfile(member).read()
+        except (zipfile.BadZipFile, tarfile.TarError, RuntimeError, NotImplementedError) as e:
+            raise OSError(errno.EIO, 'unable to read member (%s)' % (e), member)
+
+    def close(self):
+        """ Close archive handles and mappings. """
+        with self.lock:
+            for archive in self.handle_list:
+                archive.close()
+            self.handle_list = []
+        self.offsets = self.csizes = self.sizes = self.methods = None
+        if self.index_buf is not None:
+            self.index_buf.close()
+            self.index_buf = None
+        self.buf.close()
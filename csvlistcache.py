@@ -0,0 +1,119 @@
+""" Thumbnail cache for csv file viewer application. """
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+IDENTITY_SECONDS = 2.0      # resolved file identity is reused this long before stat again
+IDENTITY_ENTRIES = 65536    # file identities kept at most
+
+class FileIdentities:
+    def __init__(self, max_entries = IDENTITY_ENTRIES, seconds = IDENTITY_SECONDS):
+        """ Only instance variable initialization. """
+        self.max_entries = max_entries
+        self.seconds = seconds
+        self.entries = OrderedDict()   # filename -> (checked time, identity or None), oldest first
+        self.lock = threading.Lock()
+
+    def get(self, filename):
+        """ Returns (resolved path, size, mtime) of file, or None if it does not exist.
+            realpath() and stat() of filename are done again only when result is older than seconds. """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(filename)
+            if entry is not None and now - entry[0] < self.seconds:
+                self.entries.move_to_end(filename)
+                return entry[1]
+        path = os.path.realpath(filename)
+        try:
+            st = os.stat(path)
+            identity = (path, st.st_size, st.st_mtime_ns)
+        except OSError:
+            identity = None
+        with self.lock:
+            self.entries[filename] = (now, identity)
+            self.entries.move_to_end(filename)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return identity
+
+identities = FileIdentities()   # shared by thumbnail cache and store
+
+class ThumbnailCache:
+    def __init__(self, budget_bytes = 256 * 1024 * 1024):
+        """ Only instance variable initialization. """
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self.entries = OrderedDict()   # key -> (image, nbytes), oldest first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(filename, imagesize, resample=None, source=None):
+        """ Make cache key of (resolved path, mtime, target size, resample).
+            filename is member name if source(ArchiveSource) is given. """
+        if source is not None:
+            identity = source.stat(filename)
+            if identity is None:
+                return None
+            path, size, mtime = identity
+        else:
+            identity = identities.get(filename)
+            if identity is None:
+                return None
+            path, size, mtime = identity
+        if imagesize is not None:
+            imagesize = tuple(imagesize)
+        return (path, mtime, imagesize, resample)
+
+    @staticmethod
+    def image_bytes(image):
+        """ Estimate pixel buffer size of image(PIL.Image). """
+        width, height = image.size
+        return width * height * len(image.getbands())
+
+    def get(self, key):
+        """ Returns cached image for key, or None. """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, image):
+        """ Store image for key, then evicts least recently used entries. """
+        nbytes = self.image_bytes(image)
+        with self.lock:
+            if nbytes > self.budget_bytes:
+                # never fits, so it is not cached at all.
+                return False
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.used_bytes -= old[1]
+            self.entries[key] = (image, nbytes)
+            self.used_bytes += nbytes
+            while self.used_bytes > self.budget_bytes:
+                _, (_, evicted_bytes) = self.entries.popitem(last=False)
+                self.used_bytes -= evicted_bytes
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        """ Drop all entries (counters are kept). """
+        with self.lock:
+            self.entries.clear()
+            self.used_bytes = 0
+
+    def get_stats(self):
+        """ Returns counters as dictionary. """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'entries': len(self.entries),
+                    'used_bytes': self.used_bytes,
+                    'budget_bytes': self.budget_bytes}
@@ -0,0 +1,228 @@
+""" Columnar row storage for csv file viewer application.
+
+Rows are stored per column. A column starts dictionary-encoded (array of
+integer codes and a list of distinct values); when it has too many distinct
+values it is converted to one contiguous utf-8 buffer with an offsets
+array. Row tuples are built only when they are requested. Rows shorter than
+others are padded with empty values, which are excluded from query results
+by the number of fields of each row.
+"""
+
+from array import array
+from itertools import accumulate, chain
+from collections import Counter
+from csvlistquery import scan_buffer
+
+MAX_CODES = 65536   # distinct values of dictionary-encoded column
+MIN_CODES = 1024    # over this, column mostly of distinct values is converted early
+
+class DictColumn:
+    def __init__(self, rows=0):
+        """ Column with all rows empty. """
+        self.values = ['']
+        self.lookup = {'': 0}
+        self.codes = array('H', bytes(2 * rows))
+        # inverted index: sorted row ids of each code, kept up to date by
+        # append/extend once built. None until build_index().
+        self.index = None
+
+    def build_index(self):
+        """ Build inverted index of value -> sorted row ids. """
+        if self.index is not None:
+            return      # already built, appended rows are in it
+        # counting sort in one pass: row ids are ascending within each code.
+        self.index = [array('I') for code in range(len(self.values))]
+        appends = [rows.append for rows in self.index]
+        for row, code in enumerate(self.codes):
+            appends[code](row)
+
+    def postings(self, code):
+        """ Returns sorted row ids of code. """
+        if self.index is None:
+            self.build_index()
+        return self.index[code][:]  # copy, not to change with appended rows
+
+    def find_rows(self, value, exact):
+        """ Returns sorted row ids which match value. """
+        if exact:
+            code = self.lookup.get(value)
+            if code is None:
+                return array('I')
+            return self.postings(code)
+        rows = array('I')
+        for code, text in enumerate(self.values):
+            if value in text:
+                rows.extend(self.postings(code))
+        return array('I', sorted(rows))
+
+    def column_order(self, key):
+        """ Returns all row ids ordered by key of value, distinct values are sorted only. """
+        if self.index is None:
+            self.build_index()
+        order = array('I')
+        for code in sorted(range(len(self.values)), key=lambda code: key(self.values[code])):
+            order.extend(self.index[code])
+        return order
+
+    def append(self, value):
+        """ Append value, returns False if column has too many distinct values. """
+        code = self.lookup.get(value)
+        if code is None:
+            count = len(self.values)
+            if count >= MAX_CODES or (count >= MIN_CODES and count * 2 > len(self.codes)):
+                return False
+            code = len(self.values)
+            self.values.append(value)
+            self.lookup[value] = code
+            if self.index is not None:
+                self.index.append(array('I'))
+        if self.index is not None:
+            # id of new row is the largest, so postings stay sorted.
+            self.index[code].append(len(self.codes))
+        self.codes.append(code)
+        return True
+
+    def extend(self, values):
+        """ Append values, returns number of values appended. """
+        codes = list(map(self.lookup.get, values))
+        if None not in codes:
+            if self.index is not None:
+                index = self.index
+                for row, code in enumerate(codes, len(self.codes)):
+                    index[code].append(row)
+            self.codes.extend(codes)
+            return len(codes)
+        for i, value in enumerate(values):
+            if not self.append(value):
+                return i
+        return len(values)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+class TextColumn:
+    lookup = None   # not dictionary-encoded
+
+    def __init__(self, rows=0):
+        """ Column with all rows empty. """
+        self.buffer = bytearray()
+        self.offsets = array('Q', bytes(8 * (rows + 1)))
+
+    @classmethod
+    def from_column(cls, column):
+        """ Convert DictColumn into TextColumn. """
+        text = cls()
+        encoded = [value.encode('utf-8', 'surrogatepass') for value in column.values]
+        for code in column.codes:
+            text.buffer += encoded[code]
+            text.offsets.append(len(text.buffer))
+        return text
+
+    def append(self, value):
+        """ Append value (always succeeds). """
+        self.buffer += value.encode('utf-8', 'surrogatepass')
+        self.offsets.append(len(self.buffer))
+        return True
+
+    def extend(self, values):
+        """ Append values, returns number of values appended. """
+        encoded = [value.encode('utf-8', 'surrogatepass') for value in values]
+        ends = accumulate(chain((len(self.buffer),), map(len, encoded)))
+        next(ends)  # offset of first value is already in self.offsets
+        self.offsets.extend(ends)
+        self.buffer += b''.join(encoded)
+        return len(values)
+
+    def build_index(self):
+        """ Nothing to build, buffer is searched directly. """
+        pass
+
+    def find_rows(self, value, exact):
+        """ Returns sorted row ids which match value. """
+        return scan_buffer(self.buffer, self.offsets, value, exact)
+
+    def column_order(self, key):
+        """ Returns all row ids ordered by key of value. """
+        keys = list(map(key, (self[i] for i in range(len(self)))))
+        return array('I', sorted(range(len(keys)), key=keys.__getitem__))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].decode('utf-8', 'surrogatepass')
+
+class ColumnStore:
+    def __init__(self):
+        """ Empty store, used like list of row tuples. """
+        self.columns = []
+        self.widths = array('H')    # number of fields of each row
+        self.missing = []           # number of padded rows of each column
+
+    def append(self, row):
+        """ Append one row(sequence of texts). """
+        self.extend((row,))
+
+    def extend(self, rows):
+        """ Append rows, column by column. """
+        rows = list(rows)
+        if len(rows) == 0:
+            return
+        widths = array('H', map(len, rows))
+        columns = self.columns
+        while len(columns) < max(widths):
+            # wider row than before, earlier rows are empty in new column.
+            columns.append(DictColumn(len(self.widths)))
+            self.missing.append(len(self.widths))
+        width = len(columns)
+        if min(widths) < width:
+            padding = ('',) * width
+            rows = [row if len(row) == width else tuple(row) + padding[len(row):] for row in rows]
+            counts = Counter(widths)
+            for c in range(width):
+                self.missing[c] += sum(count for w, count in counts.items() if w <= c)
+        for i, values in enumerate(zip(*rows)):
+            column = columns[i]
+            count = column.extend(values)
+            if count < len(values):
+                column = columns[i] = TextColumn.from_column(column)
+                column.extend(values[count:])
+        self.widths.extend(widths)
+
+    def build_indexes(self):
+        """ Build inverted indexes of all columns. """
+        for column in self.columns:
+            column.build_index()
+
+    def find_rows(self, column, value, exact):
+        """ Returns sorted row ids whose column matches value. """
+        if column >= len(self.columns):
+            return array('I')
+        rows = self.columns[column].find_rows(value, exact)
+        if self.missing[column] > 0:
+            # padded values are not in rows, as csv.reader rows are not.
+            widths = self.widths
+            rows = array('I', [row for row in rows if widths[row] > column])
+        return rows
+
+    def column_order(self, column, key):
+        """ Returns all row ids ordered by key of column value (stable). """
+        if column >= len(self.columns):
+            return array('I', range(len(self.widths)))
+        return self.columns[column].column_order(key)
+
+    def __len__(self):
+        return len(self.widths)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.widths)
+        width = self.widths[i]
+        return tuple(self.columns[c][i] for c in range(width))
+
+    def __iter__(self):
+        for i in range(len(self.widths)):
+            yield self[i]
@@ -0,0 +1,327 @@
+""" Out-of-process image decoding for csv file viewer application.
+
+Pillow holds the GIL while it decodes large PNG/TIFF files, so threads do
+not decode in parallel. DecodeEngine runs decoders in worker processes.
+Each job is given a slot of one shared memory block, and the worker writes
+pixels of the thumbnail into it; only job id, mode and size go through the
+pipe. A dispatcher thread in main process hands jobs to idle workers, turns
+replies into PIL images, and restarts workers which died (i.e. crashed in
+decoder on a corrupt file), failing only the job they were running. Restart
+is delayed longer for each death in a row before receiving any job (i.e.
+archive could not be opened), and such a worker is not restarted after
+MAX_DEATHS of them.
+"""
+
+import sys
+import time
+import threading
+import multiprocessing
+from multiprocessing.connection import wait
+from collections import deque
+from concurrent.futures import Future
+from PIL import Image
+from csvlistimage import decode_thumbnail, ImageTooLarge
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:     # python 3.7 and earlier
+    shared_memory = None
+
+MODES = ('L', 'RGB', 'RGBA')    # modes of thumbnails sent back, 4 bytes per pixel at most
+QUEUE_PER_WORKER = 16           # jobs waiting for worker, submit() blocks over it
+POLL_SECONDS = 0.5
+RESTART_SECONDS = 0.1           # delay before restarting dead worker, doubled for each death in a row
+MAX_RESTART_SECONDS = 10.0
+MAX_DEATHS = 5                  # worker dead this many times in a row before any job is not restarted
+
+def attach_memory(name):
+    """ Attach shared memory created by main process, without tracking it in this process. """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:       # before python 3.13
+        return shared_memory.SharedMemory(name=name)
+
+def worker_main(conn, memory_name, slot_bytes, resample, reducing_gap, max_bytes, archive):
+    """ Worker process: decode jobs (job id, slot, file name, image size) from conn. """
+    memory = attach_memory(memory_name)
+    source = None
+    if archive is not None:
+        from csvlistarchive import ArchiveSource
+        # member directory is written to sidecar by main process, workers only read it.
+        source = ArchiveSource(archive, readonly=True)
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        job_id, slot, filename, imagesize = job
+        try:
+            fp = filename if source is None else source.open(filename)
+            try:
+                image = decode_thumbnail(fp, imagesize, resample, reducing_gap, max_bytes)
+            finally:
+                if fp is not filename:
+                    fp.close()
+            if image.mode not in MODES:
+                if 'A' in image.getbands() or 'transparency' in image.info:
+                    image = image.convert('RGBA')
+                else:
+                    image = image.convert('RGB')
+            data = image.tobytes()
+            if len(data) > slot_bytes:
+                raise ValueError('thumbnail is larger than slot: %s' % (filename))
+            start = slot * slot_bytes
+            memory.buf[start:start + len(data)] = data
+            reply = (job_id, None, image.mode, image.size)
+        except ImageTooLarge as e:
+            reply = (job_id, str(e), None, e.size)     # error with size is refusal
+        except Exception as e:
+            reply = (job_id, '%s (%s)' % (e, type(e).__name__), None, None)
+        try:
+            conn.send(reply)
+        except (OSError, ValueError):
+            break
+    memory.close()
+
+class Worker:
+    def __init__(self, context, engine):
+        """ Start one worker process. """
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=worker_main, daemon=True,
+                                       args=(child_conn, engine.memory.name, engine.slot_bytes,
+                                             engine.resample, engine.reducing_gap, engine.max_bytes,
+                                             engine.archive))
+        self.process.start()
+        child_conn.close()
+        self.job = None     # (job id, slot, filename, imagesize, future) in progress
+        self.deaths = 0     # deaths in a row before any job, of this worker and ones it replaced
+        self.received = False   # True after first job is sent
+
+class DecodeEngine:
+    def __init__(self, workers, imagesize, resample='bicubic', reducing_gap=2.0, archive=None,
+                 max_bytes=None):
+        """ Start worker processes for thumbnails up to imagesize (raises OSError).
+            archive is path of zip/tar file given as image directory, or None.
+            max_bytes is memory ceiling of one image passed to decode_thumbnail. """
+        if shared_memory is None:
+            raise OSError('decode workers require python 3.8 and later')
+        self.resample = resample
+        self.reducing_gap = reducing_gap
+        self.archive = archive
+        self.max_bytes = max_bytes
+        self.slot_bytes = imagesize[0] * imagesize[1] * 4
+        self.slots = workers        # one job for each worker
+        self.memory = shared_memory.SharedMemory(create=True, size=self.slot_bytes * self.slots)
+        self.free_slots = list(range(self.slots))
+        self.queue = deque()        # jobs not handed to worker yet
+        self.max_queue = workers * QUEUE_PER_WORKER
+        self.condition = threading.Condition()
+        self.next_id = 0
+        self.closed = False
+        self.restarts = 0
+        self.pending = {}           # index of dead worker -> (restart time, deaths)
+        self.completed = 0
+        self.failed = 0
+        # spawn, since forking a process with Tk and threads is not safe.
+        self.context = multiprocessing.get_context('spawn')
+        self.wake_reader, self.wake_writer = self.context.Pipe(duplex=False)
+        self.workers = [Worker(self.context, self) for i in range(workers)]
+        self.thread = threading.Thread(target=self.dispatch, daemon=True)
+        self.thread.start()
+
+    def fits(self, imagesize):
+        """ Returns True if thumbnail of imagesize fits in a slot. """
+        return imagesize is not None and imagesize[0] * imagesize[1] * 4 <= self.slot_bytes
+
+    def submit(self, filename, imagesize):
+        """ Queue decode job, returns Future of PIL.Image. Blocks while queue is full. """
+        future = Future()
+        with self.condition:
+            while len(self.queue) >= self.max_queue and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                raise RuntimeError('decode engine is shut down')
+            if not self.running():
+                future.set_exception(OSError('no decoder process is running'))
+                return future
+            self.queue.append((self.next_id, filename, tuple(imagesize), future))
+            self.next_id += 1
+        self.wake_writer.send_bytes(b'')
+        return future
+
+    def cancel(self):
+        """ Cancel jobs which are not handed to worker yet. """
+        with self.condition:
+            for job in self.queue:
+                job[3].cancel()
+            self.queue.clear()
+            self.condition.notify_all()
+
+    def assign(self):
+        """ Hand queued jobs to idle workers (condition must be held). """
+        for worker in self.workers:
+            if worker is None or worker.job is not None:
+                continue
+            while len(self.queue) > 0 and len(self.free_slots) > 0:
+                job_id, filename, imagesize, future = self.queue.popleft()
+                self.condition.notify_all()
+                if not future.set_running_or_notify_cancel():
+                    continue    # cancelled
+                slot = self.free_slots.pop()
+                worker.job = (job_id, slot, filename, imagesize, future)
+                worker.received = True
+                try:
+                    worker.conn.send((job_id, slot, filename, imagesize))
+                except (OSError, ValueError):
+                    pass        # worker died, found by its sentinel
+                break
+
+    def dispatch(self):
+        """ Dispatcher thread: assign jobs, and receive results. """
+        while True:
+            with self.condition:
+                if self.closed:
+                    return
+                timeout = self.respawn()
+                self.assign()
+                waitables = [self.wake_reader]
+                for worker in self.workers:
+                    if worker is not None:
+                        waitables.append(worker.conn)
+                        waitables.append(worker.process.sentinel)
+            ready = wait(waitables, timeout)
+            if self.wake_reader in ready:
+                while self.wake_reader.poll():
+                    self.wake_reader.recv_bytes()
+            for i, worker in enumerate(self.workers):
+                if worker is None:
+                    continue
+                if worker.conn in ready:
+                    try:
+                        reply = worker.conn.recv()
+                    except (EOFError, OSError):
+                        reply = None
+                    if reply is not None:
+                        self.finish(worker, reply)
+                        continue
+                if worker.process.sentinel in ready or worker.conn in ready:
+                    self.restart(i)
+
+    def finish(self, worker, reply):
+        """ Complete job of worker with reply. """
+        job_id, error, mode, size = reply
+        with self.condition:
+            if worker.job is None or worker.job[0] != job_id:
+                return
+            current_id, slot, filename, imagesize, future = worker.job
+            worker.job = None
+        image = None
+        if error is None:
+            length = size[0] * size[1] * len(mode)
+            start = slot * self.slot_bytes
+            with self.memory.buf[start:start + length] as view:
+                image = Image.frombytes(mode, size, view)
+        with self.condition:
+            self.free_slots.append(slot)
+        if error is None:
+            self.completed += 1
+            future.set_result(image)
+        elif size is not None:
+            self.failed += 1
+            future.set_exception(ImageTooLarge(error, size))
+        else:
+            self.failed += 1
+            future.set_exception(OSError('unable to decode: %s: %s' % (filename, error)))
+
+    def restart(self, i):
+        """ Replace dead worker i after delay, its job fails. Queued jobs fail when no worker is left. """
+        worker = self.workers[i]
+        if worker.process.is_alive():
+            return
+        stranded = []
+        with self.condition:
+            if self.closed:
+                return
+            job = worker.job
+            worker.job = None
+            if job is not None:
+                self.free_slots.append(job[1])
+            self.workers[i] = None
+            # dying in decoder of a job is not in a row, only failures to start are.
+            deaths = 1 if worker.received else worker.deaths + 1
+            if deaths < MAX_DEATHS:
+                delay = min(MAX_RESTART_SECONDS, RESTART_SECONDS * 2 ** (deaths - 1))
+                self.pending[i] = (time.monotonic() + delay, deaths)
+            elif not self.running():
+                stranded = list(self.queue)
+                self.queue.clear()
+                self.condition.notify_all()
+        worker.conn.close()
+        if job is not None:
+            self.failed += 1
+            job[4].set_exception(OSError('decoder process exited(%s): %s' % (worker.process.exitcode, job[2])))
+        if deaths < MAX_DEATHS:
+            print('decoder process exited(%s), restarting in %.1f seconds'
+                  % (worker.process.exitcode, delay), file=sys.stderr)
+        else:
+            print('decoder process exited(%s) %d times in a row, not restarted'
+                  % (worker.process.exitcode, deaths), file=sys.stderr)
+        for job_id, filename, imagesize, future in stranded:
+            if future.set_running_or_notify_cancel():
+                self.failed += 1
+                future.set_exception(OSError('no decoder process is running: %s' % (filename)))
+
+    def respawn(self):
+        """ Start workers whose restart time has come (condition must be held).
+            Returns seconds to wait for results until next restart. """
+        now = time.monotonic()
+        timeout = POLL_SECONDS
+        for i, (when, deaths) in list(self.pending.items()):
+            if when > now:
+                timeout = min(timeout, when - now)
+                continue
+            del self.pending[i]
+            self.workers[i] = Worker(self.context, self)
+            self.workers[i].deaths = deaths
+            self.restarts += 1
+        return timeout
+
+    def running(self):
+        """ Returns True if any worker is running or will be restarted. """
+        with self.condition:
+            return len(self.pending) > 0 or any(worker is not None for worker in self.workers)
+
+    def get_stats(self):
+        """ Returns counters as dictionary. """
+        with self.condition:
+            return {'workers': sum(worker is not None for worker in self.workers),
+                    'queued': len(self.queue),
+                    'completed': self.completed, 'failed': self.failed,
+                    'restarts': self.restarts}
+
+    def shutdown(self):
+        """ Stop workers and release shared memory. """
+        self.cancel()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.wake_writer.send_bytes(b'')
+        self.thread.join()
+        self.pending = {}
+        self.workers = [worker for worker in self.workers if worker is not None]
+        for worker in self.workers:
+            try:
+                worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self.workers:
+            worker.process.join(1.0)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            if worker.job is not None:
+                worker.job[4].set_exception(OSError('decode engine is shut down'))
+            worker.conn.close()
+        self.memory.close()
+        self.memory.unlink()
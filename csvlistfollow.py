@@ -0,0 +1,52 @@
+""" Follow(tail) mode of csv file viewer application.
+
+Csv file could be appended by another process while it is displayed.
+TailReader returns only complete records appended since last read, and
+holds partial last record until its newline is written.
+"""
+
+import os
+import locale
+from csvlistlazy import complete_length, same_file
+
+READ_BYTES = 16 * 1024 * 1024   # maximum bytes read at once
+
+class TailReader:
+    def __init__(self, filename, encoding=None):
+        """ Open csv file to read from top (raises OSError). """
+        if encoding is None:
+            encoding = locale.getpreferredencoding(False)
+        self.filename = filename
+        self.encoding = encoding
+        self.file = open(filename, 'rb')
+        self.offset = 0         # byte offset after last complete record
+        self.pending = b''      # partial record after offset
+
+    def read(self, limit=READ_BYTES):
+        """ Returns bytes of complete records appended since last call(b'' if none),
+            or None if file was truncated or replaced. """
+        if not same_file(self.filename, self.file):
+            return None
+        position = self.offset + len(self.pending)
+        size = os.fstat(self.file.fileno()).st_size
+        if size < position:
+            return None
+        self.file.seek(position)
+        data = self.pending
+        length = 0
+        while position < size:
+            chunk = self.file.read(limit)
+            if len(chunk) == 0:
+                break
+            position += len(chunk)
+            data += chunk
+            length = complete_length(data)
+            if length > 0:
+                break       # otherwise, one record is longer than limit
+        self.pending = data[length:]
+        self.offset += length
+        return data[:length]
+
+    def close(self):
+        """ Close csv file. """
+        self.file.close()
@@ -0,0 +1,108 @@
+""" Image decoding for csv file viewer application. """
+
+from PIL import Image, ImageDraw
+from csvlistprofile import stage
+
+# resample filters selectable from command line.
+RESAMPLE_FILTERS = {
+    'nearest': Image.NEAREST,
+    'box': Image.BOX,
+    'bilinear': Image.BILINEAR,
+    'hamming': Image.HAMMING,
+    'bicubic': Image.BICUBIC,
+    'lanczos': Image.LANCZOS,
+}
+
+# decoding may use this many times of memory ceiling, before image is shrunk.
+DECODE_FACTOR = 4
+
+UNREADABLE_SIZE = (64, 64)  # size of unreadable image shown without target size
+
+class ImageTooLarge(OSError):
+    """ Image refused, since decoding it would exceed memory ceiling. """
+    def __init__(self, message, size):
+        super().__init__(message)
+        self.size = size    # size image would have been shown at
+
+def fit_size(size, bands, max_bytes):
+    """ Returns size shrunk to keep size * bands within max_bytes (None is no ceiling). """
+    width, height = size
+    if max_bytes is None or width * height * bands <= max_bytes:
+        return size
+    ratio = (max_bytes / (width * height * bands)) ** 0.5
+    return (max(1, int(width * ratio)), max(1, int(height * ratio)))
+
+def fit_box(size, box):
+    """ Returns size shrunk into box(width, height), keeping aspect ratio. """
+    width, height = size
+    box_width, box_height = box
+    # height fills box unless image is relatively wider than box.
+    fitted_width = int(width * box_height / height)
+    if fitted_width <= box_width:
+        return (max(1, fitted_width), box_height)
+    return (box_width, max(1, int(height * box_width / width)))
+
+def refused_image(size):
+    """ Returns crossed gray image shown instead of refused one. """
+    image = Image.new('RGB', size, 'gray')
+    draw = ImageDraw.Draw(image)
+    draw.line((0, 0, size[0] - 1, size[1] - 1), fill='lightgray')
+    draw.line((0, size[1] - 1, size[0] - 1, 0), fill='lightgray')
+    return image
+
+def unreadable_image(size=None):
+    """ Returns dark gray image shown instead of one which could not be read. """
+    return Image.new('RGB', size if size is not None else UNREADABLE_SIZE, 'dimgray')
+
+def decode_thumbnail(fp, imagesize=None, resample='bicubic', reducing_gap=2.0, max_bytes=None):
+    """ Decode image file(name or file object) and shrink it into imagesize.
+
+    Image keeps its own aspect ratio, so it is as tall as imagesize unless it
+    is wider than imagesize.
+
+    When reducing_gap is given and imagesize is much smaller than the source,
+    JPEG is decoded at 1/2, 1/4 or 1/8 scale by draft mode, and resize uses
+    reduce() before resampling. Otherwise image is fully decoded and resized.
+
+    max_bytes is memory ceiling of one image: without imagesize, image larger
+    than it is shrunk to fit, and image which needs more than DECODE_FACTOR
+    times of it to decode raises ImageTooLarge. Source image is closed as
+    soon as it is shrunk.
+    """
+    with stage('open'):
+        image = Image.open(fp)
+    result = None
+    try:
+        bands = len(image.getbands())
+        if imagesize is None:
+            imagesize = fit_size(image.size, bands, max_bytes)
+            if imagesize == image.size:
+                with stage('load'):
+                    image.load()
+                result = image
+                return result
+        else:
+            imagesize = fit_box(image.size, imagesize)
+        width, height = image.size
+        target_width, target_height = imagesize
+        if reducing_gap is None or reducing_gap < 1.0 \
+           or width < target_width * 2 or height < target_height * 2:
+            # not small enough to be worth reducing, decode at native resolution.
+            reducing_gap = None
+        elif image.format == 'JPEG':
+            # decoder scales down, but never below imagesize * reducing_gap.
+            draft_size = (int(target_width * reducing_gap), int(target_height * reducing_gap))
+            image.draft(image.mode, draft_size)
+        if max_bytes is not None:
+            width, height = image.size      # size to be decoded, after draft
+            if width * height * bands > max_bytes * DECODE_FACTOR:
+                raise ImageTooLarge('image is too large to decode (%dx%d): %s'
+                                    % (width, height, getattr(fp, 'name', fp)), imagesize)
+        with stage('resize'):
+            result = image.resize(imagesize, resample=RESAMPLE_FILTERS[resample],
+                                  reducing_gap=reducing_gap)
+        return result
+    finally:
+        if result is not image:
+            # release decoded pixels (and file) of source as soon as it is shrunk.
+            image.close()
@@ -0,0 +1,143 @@
+""" Sidecar index file of csv file viewer application.
+
+Sidecar file(<csv>.idx) keeps directory list, row ids of each directory and
+record offsets of lazy backend. It is validated by size, mtime and hashes of
+the csv file, and loaded with mmap without copying arrays.
+
+layout (little-endian):
+    header      magic, version, number of sections, csv size, csv mtime,
+                indexed end offset, rows, hashed length, head hash, tail hash,
+                encoding
+    sections    table of (name, offset, length), then 8-byte aligned data
+"""
+
+import os
+import sys
+import mmap
+import json
+import struct
+import hashlib
+from array import array
+
+MAGIC = b'CSVLIDX\0'
+VERSION = 2     # 2: records end with \r as well as \n
+HEADER = struct.Struct('<8sII QqQQQ 32s32s 16s')
+SECTION = struct.Struct('<8sQQ')
+HEAD_BYTES = 64 * 1024      # bytes hashed from top of csv file
+TAIL_BYTES = 4 * 1024       # bytes hashed before indexed end
+
+def sidecar_name(filename):
+    """ Returns sidecar file name of csv file. """
+    return filename + '.idx'
+
+def raw_bytes(values):
+    """ Returns byte view of array or memoryview, for array.frombytes. """
+    return memoryview(values).cast('B')
+
+def hash_range(buf, start, end):
+    """ Returns sha256 digest of buf[start:end]. """
+    return hashlib.sha256(buf[start:end]).digest()
+
+class CsvIndex:
+    """ Contents of sidecar index. """
+    def __init__(self, end, offsets, path_indexes, encoding, extra=None):
+        self.end = end                      # byte offset after last indexed record
+        self.offsets = offsets              # array or memoryview of 'Q'
+        self.path_indexes = path_indexes    # dirname -> array or memoryview of 'I'
+        self.encoding = encoding
+        self.extra = extra if extra is not None else {}    # name -> bytes-like
+        self.appended = False               # True if only tail of csv was new
+
+def write_index(filename, buf, index):
+    """ Write sidecar index of csv file(buf is its content), returns False on error. """
+    st = os.stat(filename)
+    hashed = min(HEAD_BYTES, index.end)
+    head_hash = hash_range(buf, 0, hashed)
+    tail_hash = hash_range(buf, max(0, index.end - TAIL_BYTES), index.end)
+    path_list = sorted(index.path_indexes.keys())
+    ranges = array('Q')
+    rowids = array('I')
+    for path in path_list:
+        ranges.append(len(rowids))
+        ranges.append(len(index.path_indexes[path]))
+        rowids.frombytes(raw_bytes(index.path_indexes[path]))
+    sections = [(b'paths', json.dumps(path_list).encode('utf-8')),
+                (b'ranges', ranges.tobytes()),
+                (b'rowids', rowids.tobytes()),
+                (b'offsets', raw_bytes(index.offsets))]
+    for name, data in sorted(index.extra.items()):
+        sections.append((name, raw_bytes(data)))
+    position = HEADER.size + SECTION.size * len(sections)
+    table = []
+    for name, data in sections:
+        position = (position + 7) & ~7
+        table.append(SECTION.pack(name, position, len(data)))
+        position += len(data)
+    header = HEADER.pack(MAGIC, VERSION, len(sections), st.st_size, st.st_mtime_ns,
+                         index.end, len(index.offsets), hashed, head_hash, tail_hash,
+                         index.encoding.encode('ascii')[:16])
+    tmpname = sidecar_name(filename) + '.tmp'
+    try:
+        with open(tmpname, 'wb') as f:
+            f.write(header)
+            f.write(b''.join(table))
+            for name, data in sections:
+                f.write(b'\0' * (-f.tell() % 8))
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # atomic replacement, so a crash never leaves half-written sidecar.
+        os.replace(tmpname, sidecar_name(filename))
+    except OSError as e:
+        print('unable to write index file: %s (%s)' % (sidecar_name(filename), e), file=sys.stderr)
+        return False
+    return True
+
+def read_index(filename, buf):
+    """ Load sidecar index if it is valid for csv file(buf is its content).
+
+    Returns CsvIndex, or None if sidecar does not exist or is stale.
+    When csv file was only appended, returned index has appended=True and
+    covers the old part of the file.
+    """
+    try:
+        with open(sidecar_name(filename), 'rb') as f:
+            idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(idx) < HEADER.size:
+        return None
+    (magic, version, nsections, size, mtime, end, rows, hashed,
+     head_hash, tail_hash, encoding) = HEADER.unpack_from(idx, 0)
+    if magic != MAGIC or version != VERSION:
+        return None
+    st = os.stat(filename)
+    if st.st_size < end or len(buf) < end:
+        return None
+    if hash_range(buf, 0, hashed) != head_hash:
+        return None
+    unchanged = st.st_size == size and st.st_mtime_ns == mtime
+    if not unchanged:
+        # appended only if file grew and old tail is untouched, otherwise scanned again.
+        if st.st_size <= size or hash_range(buf, max(0, end - TAIL_BYTES), end) != tail_hash:
+            return None
+    view = memoryview(idx)
+    sections = {}
+    for i in range(nsections):
+        name, offset, length = SECTION.unpack_from(idx, HEADER.size + SECTION.size * i)
+        sections[name.rstrip(b'\0')] = view[offset:offset + length]
+    path_list = json.loads(bytes(sections[b'paths']).decode('utf-8'))
+    ranges = sections[b'ranges'].cast('Q')
+    rowids = sections[b'rowids'].cast('I')
+    path_indexes = {}
+    for i, path in enumerate(path_list):
+        start = ranges[i * 2]
+        path_indexes[path] = rowids[start:start + ranges[i * 2 + 1]]
+    offsets = sections[b'offsets'].cast('Q')
+    extra = {}
+    for name, data in sections.items():
+        if name not in (b'paths', b'ranges', b'rowids', b'offsets'):
+            extra[name] = data
+    index = CsvIndex(end, offsets, path_indexes, encoding.rstrip(b'\0').decode('ascii'), extra)
+    index.appended = not unchanged
+    return index
@@ -0,0 +1,315 @@
+""" Offset-indexed lazy csv backend for csv file viewer application.
+
+The csv file is memory-mapped, and only byte offsets of records are kept.
+Each record is parsed by csv module when it is requested.
+"""
+
+import io
+import os
+import re
+import csv
+import mmap
+import struct
+import locale
+from array import array
+from collections import OrderedDict
+from csvlistindex import CsvIndex, read_index, write_index, raw_bytes
+from csvlistquery import scan_buffer, scan_rows, match_value
+
+EXTRA_ROWS = b'extrows'     # sidecar section of rows other extra sections are valid for
+
+# one csv record: quoted fields may contain newlines, "" is two quoted runs. records end with
+# \r\n, \r or \n, as lines of text file opened with universal newlines(newline=None).
+RECORD_PATTERN = re.compile(rb'[^"\r\n]*(?:"[^"]*"[^"\r\n]*)*(?:\r\n|\r|\n|\Z)')
+
+def parse_record(data, encoding):
+    """ Parse bytes of one record into tuple of texts, like csv.reader does. """
+    text = data.decode(encoding)
+    reader = csv.reader(io.StringIO(text, newline=None), delimiter=',', skipinitialspace=True)
+    for row in reader:
+        return tuple(row)
+    return ()   # empty line
+
+def first_field(data, encoding):
+    """ Returns first field text of one record, or None for empty line. """
+    record = data.rstrip(b'\r\n')
+    if len(record) == 0:
+        return None
+    head = record.lstrip(b' ')
+    if head.startswith(b'"'):
+        # quoted field, leave it to csv module.
+        row = parse_record(data, encoding)
+        if len(row) == 0:
+            return None
+        return row[0]
+    end = head.find(b',')
+    if end < 0:
+        return head.decode(encoding)
+    return head[:end].decode(encoding)
+
+def scan_records(buf, start, end, encoding, first_row=0, offsets=None, path_indexes=None):
+    """ Scan records which start in [start, end) of buf(bytes or mmap).
+
+    start must be on a record boundary. Appends record offsets to offsets,
+    and row ids grouped by directory of first field to path_indexes.
+    Returns (offset after last scanned record, number of records).
+    """
+    if offsets is None:
+        offsets = array('Q')
+    if path_indexes is None:
+        path_indexes = {}
+    match = RECORD_PATTERN.match
+    dirname = os.path.dirname
+    pos = start
+    row = first_row
+    size = len(buf)
+    while pos < end:
+        m = match(buf, pos)
+        if m is None or m.end() == pos:
+            # unterminated quote, rest of data is one record.
+            next_pos = size
+        else:
+            next_pos = m.end()
+        offsets.append(pos)
+        field = first_field(buf[pos:next_pos], encoding)
+        if field is not None:
+            key = dirname(field)
+            indexes = path_indexes.get(key)
+            if indexes is None:
+                path_indexes[key] = indexes = array('I')
+            indexes.append(row)
+        pos = next_pos
+        row += 1
+    return pos, row - first_row
+
+def complete_length(data):
+    """ Returns length of complete records(ending with newline outside quotes) at top of data.
+
+    data must start on a record boundary. Rest of data is a partial record
+    which is still being written. \\r at the end is not complete, since \\n of
+    \\r\\n could follow it.
+    """
+    quotes = data.count(b'"')
+    pos = len(data)
+    while True:
+        newline = max(data.rfind(b'\n', 0, pos), data.rfind(b'\r', 0, pos))
+        if newline < 0:
+            return 0
+        quotes -= data.count(b'"', newline + 1, pos)
+        if quotes % 2 == 0 and (newline + 1 < len(data) or data[newline:] == b'\n'):
+            return newline + 1
+        pos = newline   # newline in quoted field, or \r at the end
+
+def same_file(filename, f):
+    """ Returns True if filename is still the file opened as f (not replaced). """
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return False
+    opened = os.fstat(f.fileno())
+    return (st.st_dev, st.st_ino) == (opened.st_dev, opened.st_ino)
+
+class RecordBounds:
+    """ Sequence of record offsets followed by end offset of last record. """
+    def __init__(self, lines):
+        self.offsets = lines.offsets
+        self.end = lines.end
+
+    def __len__(self):
+        return len(self.offsets) + 1
+
+    def __getitem__(self, i):
+        if i == len(self.offsets):
+            return self.end
+        return self.offsets[i]
+
+class LazyLines:
+    def __init__(self, filename, encoding=None, cache_rows=1024):
+        """ Open csv file with mmap (raises OSError). """
+        if encoding is None:
+            encoding = locale.getpreferredencoding(False)
+        self.filename = filename
+        self.encoding = encoding
+        self.cache_rows = cache_rows
+        self.recent = OrderedDict()     # row -> parsed tuple
+        self.offsets = array('Q')
+        self.end = 0                    # byte offset after last indexed record
+        self.extra = {}                 # extra sections of sidecar, name -> memoryview
+        self.extra_rows = 0             # rows from top which extra sections are valid for
+        self.file = open(filename, 'rb')
+        self.buf = self.map()
+
+    def map(self):
+        """ Map whole file, returns b'' for empty file. """
+        if os.fstat(self.file.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def build_index(self, sidecar=True, jobs=1):
+        """ Scan file(or load its sidecar index), then returns row ids grouped by directory. """
+        index = None
+        if sidecar:
+            index = read_index(self.filename, self.buf)
+            if index is not None and index.encoding != self.encoding:
+                index = None
+        if index is not None and not index.appended:
+            self.offsets = index.offsets
+            self.end = index.end
+            self.load_extra(index.extra)
+            return index.path_indexes
+        path_indexes = {}
+        start = 0
+        if index is not None:
+            # csv file was appended, so only new tail is scanned.
+            self.offsets.frombytes(raw_bytes(index.offsets))
+            for path, indexes in index.path_indexes.items():
+                path_indexes[path] = array('I')
+                path_indexes[path].frombytes(raw_bytes(indexes))
+            start = index.end
+            if start > 0 and self.buf[start - 1:start] != b'\n' and len(self.offsets) > 0:
+                # last record had no newline(or \r only), it could continue in new tail.
+                self.drop_last(path_indexes)
+                start = self.offsets.pop()
+            self.load_extra(index.extra)
+        self.scan(start, path_indexes, jobs)
+        if sidecar:
+            self.write_sidecar(path_indexes)
+        return path_indexes
+
+    def load_extra(self, extra):
+        """ Keep extra sections of sidecar, with rows they are valid for. """
+        rows = len(self.offsets)
+        if EXTRA_ROWS in extra:
+            rows = min(rows, struct.unpack('<Q', extra[EXTRA_ROWS])[0])
+        self.extra = {name: data for name, data in extra.items() if name != EXTRA_ROWS}
+        self.extra_rows = rows
+
+    def write_sidecar(self, path_indexes, extra=None):
+        """ Write sidecar index of records indexed so far, with extra sections valid for all of them.
+            without extra, current extra sections are kept for rows they are valid for. """
+        if extra is None:
+            extra, rows = self.extra, self.extra_rows
+        else:
+            self.extra, self.extra_rows = extra, rows = extra, len(self.offsets)
+        sections = dict(extra)
+        if len(sections) > 0:
+            sections[EXTRA_ROWS] = struct.pack('<Q', rows)
+        return write_index(self.filename, self.buf,
+                           CsvIndex(self.end, self.offsets, path_indexes, self.encoding, sections))
+
+    def scan(self, start, path_indexes, jobs=1):
+        """ Index records from start to end of file, with multiple processes if jobs > 1. """
+        result = None
+        if jobs > 1:
+            # imported here, since csvlistparallel imports this module.
+            from csvlistparallel import parallel_scan
+            result = parallel_scan(self.filename, start, jobs, self.encoding, len(self.offsets))
+        if result is None:
+            self.end, count = scan_records(self.buf, start, len(self.buf), self.encoding,
+                                           len(self.offsets), self.offsets, path_indexes)
+            return
+        self.end, offsets, chunk_indexes, rows = result
+        self.offsets.extend(offsets)
+        for path, indexes in chunk_indexes.items():
+            if path in path_indexes:
+                path_indexes[path].extend(indexes)
+            else:
+                path_indexes[path] = indexes
+
+    def prepare_follow(self, path_indexes):
+        """ Make index growable by follow(), and hold back partial last record. """
+        offsets = array('Q')
+        offsets.frombytes(raw_bytes(self.offsets))
+        self.offsets = offsets
+        for path in list(path_indexes.keys()):
+            indexes = array('I')
+            indexes.frombytes(raw_bytes(path_indexes[path]))
+            path_indexes[path] = indexes
+        if len(self.offsets) == 0:
+            return
+        start = self.offsets[-1]
+        if complete_length(self.buf[start:self.end]) < self.end - start:
+            self.drop_last(path_indexes)
+            self.end = self.offsets.pop()
+            self.recent.pop(len(self.offsets), None)
+
+    def follow(self):
+        """ Index complete records appended to file after last call.
+
+        Returns row ids of new records grouped by directory, or None if file
+        was truncated or replaced. Old mapping is not closed, since other
+        threads could be parsing rows from it.
+        """
+        if not same_file(self.filename, self.file):
+            return None
+        size = os.fstat(self.file.fileno()).st_size
+        if size < self.end:
+            return None
+        new_indexes = {}
+        if size == len(self.buf):
+            return new_indexes
+        self.buf = self.map()
+        end = self.end + complete_length(self.buf[self.end:size])
+        if end > self.end:
+            self.end, count = scan_records(self.buf, self.end, end, self.encoding,
+                                           len(self.offsets), self.offsets, new_indexes)
+        return new_indexes
+
+    def drop_last(self, path_indexes):
+        """ Remove row id of last record from path_indexes. """
+        last = len(self.offsets) - 1
+        for path, indexes in path_indexes.items():
+            if len(indexes) > 0 and indexes[-1] == last:
+                indexes.pop()
+                if len(indexes) == 0:
+                    del path_indexes[path]
+                break
+
+    def find_rows(self, column, value, exact):
+        """ Returns sorted row ids whose column matches value.
+            only records which contain value bytes are parsed. """
+        if '"' in value:
+            # quotes are escaped in file, so value does not appear as is.
+            return scan_rows(self, column, value, exact)
+        def check(row):
+            texts = parse_record(self.buf[self.offsets[row]:bounds[row + 1]], self.encoding)
+            return column < len(texts) and match_value(texts[column], value, exact)
+        bounds = RecordBounds(self)
+        return scan_buffer(self.buf, bounds, value, exact, check, self.encoding)
+
+    def column_order(self, column, key):
+        """ Returns all row ids ordered by key of column value (stable).
+            records are parsed directly, not to flush row cache. """
+        bounds = RecordBounds(self)
+        def record_key(row):
+            texts = parse_record(self.buf[self.offsets[row]:bounds[row + 1]], self.encoding)
+            return key(texts[column] if column < len(texts) else '')
+        return array('I', sorted(range(len(self.offsets)), key=record_key))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self.offsets)
+        texts = self.recent.get(row)
+        if texts is not None:
+            self.recent.move_to_end(row)
+            return texts
+        start = self.offsets[row]
+        if row + 1 < len(self.offsets):
+            end = self.offsets[row + 1]
+        else:
+            end = self.end
+        texts = parse_record(self.buf[start:end], self.encoding)
+        self.recent[row] = texts
+        if len(self.recent) > self.cache_rows:
+            self.recent.popitem(last=False)
+        return texts
+
+    def close(self):
+        """ Release mmap and file. """
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+        self.buf = b''
+        self.file.close()
@@ -2,27 +2,94 @@
 
 import sys
 import os
+import io
 import csv
 from csvlistview import ListRow
+from csvlistimage import decode_thumbnail, fit_size, refused_image, unreadable_image, ImageTooLarge
+from csvlistlazy import LazyLines
+from csvlistparallel import parallel_scan
+from csvlistcolumns import ColumnStore
+from csvlistquery import parse_query, run_query, intersect, match_value
+from csvlistprofile import stage
+from csvlistarchive import normalize
+from csvlistfollow import TailReader
+from csvlisttree import PathTrie, prefix_range, index_rows
+from csvlistprobe import probe_sizes, size_summary
+from csvlistsort import column_order, merge_order, row_key, rank_order, selection_mask, filter_order, use_mask
+from csvlistshards import read_shards, READ_ERRORS
+from bisect import insort
+from itertools import chain
+from array import array
+import locale
 from PIL import Image
 import tkinter as tk
 
 class ListModel:
-    def __init__(self, display_rows = 10, image_directory = None):
+    def __init__(self, display_rows = 10, image_directory = None, cache = None,
+                 resample = 'bicubic', reducing_gap = 2.0, store = None, source = None,
+                 engine = None, max_image_bytes = None):
         """ Only instance variable initialization. """
         self.display_rows = display_rows
         self.image_directory = image_directory
+        self.cache = cache      # ThumbnailCache, or None to disable caching
+        self.resample = resample
+        self.reducing_gap = reducing_gap    # None decodes at native resolution
+        self.store = store      # ThumbnailStore, or None not to persist thumbnails
+        self.source = source    # ArchiveSource to read images from, or None for files
+        self.engine = engine    # DecodeEngine to decode in worker processes, or None
+        self.max_image_bytes = max_image_bytes  # memory ceiling of one image, None for no ceiling
         self.lines = None
         self.indexes = None
         self.current_pos = 0
         self.path_list = None
         self.path_indexes = None
         self.selected_path = None
+        self.selection = 'path' # path, subtree(path and all under it) or prefix(of path string)
+        self.path_rows = None   # row ids of selection, before query is applied
+        self.trie = None        # PathTrie of path_list, built when it is requested
         self.imagebase = None   # default - read from current directory
         self.selected_ids = None
+        self.query_rows = None  # sorted row ids matching query, None without query
+        self.query_terms = None
+        self.follow = False     # True to read rows appended to csv file by refresh()
+        self.tail = None        # TailReader of csv file in follow mode
+        self.sidecar = False    # True if lazy backend keeps sidecar index
+        self.image_widths = None    # array('H') of image width of each row, None until probed
+        self.image_heights = None
+        self.probe_workers = 0
+        self.summary = None     # size_summary() of probed sizes
+        self.filtered_rows = None   # row ids of selection narrowed by query, in file order
+        self.sort_column = None     # column rows are ordered by, None for file order
+        self.sort_descending = False
+        self.sort_orders = {}   # column -> all row ids ordered by column ascending
+        self.sort_ranks = {}    # column -> position of each row id in sort order
+        self.sort_mask = None   # selection_mask() of filtered_rows, None until required
+        self.sort_selected = {} # column -> filtered_rows ordered by column ascending
 
-    def read(self, filename):
-        """ Read csv file and stores contents to instance variables. """
+    def read(self, filename, lazy=False, sidecar=True, jobs=1, follow=False):
+        """ Read csv file and stores contents to instance variables.
+            filename could be list of shard files(plain or compressed) read as one csv file.
+            with follow, rows appended later are read by refresh(). """
+        self.follow = follow
+        with stage('read'):
+            self.read_file(filename, lazy, sidecar, jobs)
+
+    def read_file(self, filename, lazy=False, sidecar=True, jobs=1):
+        """ Read csv file by the way selected with arguments. """
+        if not isinstance(filename, str):
+            self.read_shards(filename, sidecar, jobs)
+            return
+        if lazy:
+            self.read_lazy(filename, sidecar, jobs)
+            if self.follow:
+                self.lines.prepare_follow(self.path_indexes)
+                self.path_list = sorted(self.path_indexes.keys())
+            return
+        if self.follow:
+            self.read_follow(filename)
+            return
+        if jobs > 1 and self.read_parallel(filename, jobs):
+            return
         try:
             f = open(filename, 'r')
         except OSError as e:
@@ -35,29 +102,215 @@ class ListModel:
             self.selected_path = None
             # initialize members to fill data
             self.path_list = []
-            self.lines = []
+            self.lines = ColumnStore()  # used like list of tuples
             self.path_indexes = {}
-            path_set = set()
+            block = []  # rows are stored to self.lines by block
             reader = csv.reader(f, delimiter=',', skipinitialspace=True)
-            for i, row in enumerate(reader):
-                if len(row) > 0:
-                    self.lines.append(tuple(row))
-                    dirname = os.path.dirname(row[0])
-                    path_set.add(dirname)
-                    if dirname in self.path_indexes:
-                        self.path_indexes[dirname].append(i)
-                    else:
-                        self.path_indexes[dirname] = [i]
-                else:
-                    self.lines.append(()) # empty tuple
-                # self.path_indexes will be used by change_path method.
-            self.path_list = list(path_set)
-            self.path_list.sort()
+            # self.path_indexes will be used by change_path method.
+            for row in index_rows(reader, self.path_indexes):
+                block.append(row)
+                if len(block) >= 4096:
+                    self.lines.extend(block)
+                    block = []
+            self.lines.extend(block)
+            self.path_list = sorted(self.path_indexes.keys())
+            self.lines.build_indexes()
 
             if len(self.path_list) <= 0:
                 print('csv file does not have valid lines: %s' % (filename), file=sys.stderr)
                 sys.exit(1)
 
+    def read_parallel(self, filename, jobs):
+        """ Read csv file with multiple processes, returns False if it was not applicable. """
+        try:
+            result = parallel_scan(filename, 0, jobs, locale.getpreferredencoding(False), with_rows=True)
+        except OSError as e:
+            print(e)
+            sys.exit(1)
+        if result is None:
+            return False
+        end, offsets, path_indexes, rows = result
+        self.indexes = []
+        self.current_pos = 0
+        self.selected_path = None
+        self.lines = ColumnStore()
+        for i in range(0, len(rows), 4096):
+            self.lines.extend(rows[i:i + 4096])
+        self.lines.build_indexes()
+        self.path_indexes = path_indexes
+        self.path_list = sorted(path_indexes.keys())
+        if len(self.path_list) <= 0:
+            print('csv file does not have valid lines: %s' % (filename), file=sys.stderr)
+            sys.exit(1)
+        return True
+
+    def read_shards(self, filenames, sidecar=True, jobs=1):
+        """ Read shard files as one csv file, by jobs processes.
+            parsed rows of each shard are kept in its sidecar file(<shard>.rows). """
+        self.indexes = []
+        self.current_pos = 0
+        self.selected_path = None
+        self.lines = ColumnStore()
+        self.path_indexes = {}
+        try:
+            for first, rows, path_indexes in read_shards(filenames, locale.getpreferredencoding(False),
+                                                         jobs, sidecar):
+                for i in range(0, len(rows), 4096):
+                    self.lines.extend(rows[i:i + 4096])
+                for path, indexes in path_indexes.items():
+                    if path in self.path_indexes:
+                        self.path_indexes[path].extend(indexes)
+                    else:
+                        self.path_indexes[path] = indexes
+        except READ_ERRORS as e:
+            print(e)
+            sys.exit(1)
+        self.lines.build_indexes()
+        self.path_list = sorted(self.path_indexes.keys())
+        if len(self.path_list) <= 0:
+            print('csv file does not have valid lines: %s' % (filenames[0]), file=sys.stderr)
+            sys.exit(1)
+
+    def read_follow(self, filename):
+        """ Read complete records of csv file, partial last line is read later by refresh(). """
+        try:
+            self.tail = TailReader(filename)
+        except OSError as e:
+            print(e)
+            sys.exit(1)
+        self.indexes = []
+        self.current_pos = 0
+        self.selected_path = None
+        self.path_list = []
+        self.lines = ColumnStore()
+        self.path_indexes = {}
+        while True:
+            result = self.read_records()
+            if result is None or result[0] == 0:
+                break
+        self.lines.build_indexes()
+        if len(self.path_list) <= 0:
+            print('csv file does not have valid lines: %s' % (filename), file=sys.stderr)
+            sys.exit(1)
+
+    def read_records(self):
+        """ Parse complete records appended to csv file. Returns (number of new rows, new paths,
+            lowest position of new rows in indexes or None), or None if file was truncated or replaced. """
+        data = self.tail.read()
+        if data is None:
+            return None
+        if len(data) == 0:
+            return 0, [], None
+        text = data.decode(self.tail.encoding)
+        reader = csv.reader(io.StringIO(text, newline=None), delimiter=',', skipinitialspace=True)
+        first = len(self.lines)
+        new_indexes = {}
+        block = []
+        for row in index_rows(reader, new_indexes, first):
+            block.append(row)
+            if len(block) >= 4096:
+                self.lines.extend(block)
+                block = []
+        self.lines.extend(block)
+        return (len(self.lines) - first,) + self.merge_rows(first, new_indexes)
+
+    def refresh(self):
+        """ Read rows appended to csv file since last call (follow mode). Returns (number of new rows,
+            new paths, lowest position of new rows in indexes or None), or None if file was truncated
+            or replaced. """
+        if not self.follow:
+            return 0, [], None
+        if self.tail is None:
+            first = len(self.lines)
+            new_indexes = self.lines.follow()
+            if new_indexes is None:
+                return None
+            return (len(self.lines) - first,) + self.merge_rows(first, new_indexes)
+        count = 0
+        paths = []
+        position = None
+        while True:
+            result = self.read_records()
+            if result is None:
+                return None
+            if result[0] == 0:
+                return count, paths, position
+            count += result[0]
+            paths.extend(result[1])
+            if result[2] is not None:
+                position = result[2] if position is None else min(position, result[2])
+
+    def merge_rows(self, first, new_indexes):
+        """ Add new row ids(from first) grouped by directory.
+            Returns (new paths, lowest position in indexes rows were inserted at, or None). """
+        new_paths = []
+        position = None
+        if self.query_terms is not None:
+            # new rows are checked one by one, not by index of whole column.
+            for i in range(first, len(self.lines)):
+                if self.match_row(i):
+                    self.query_rows.append(i)
+        selected = []
+        for path, indexes in new_indexes.items():
+            if path in self.path_indexes:
+                self.path_indexes[path].extend(indexes)
+            else:
+                self.path_indexes[path] = indexes
+                insort(self.path_list, path)
+                new_paths.append(path)
+            if self.trie is not None:
+                self.trie.add(path, len(indexes))
+            if self.selection_contains(path):
+                selected.append(indexes)
+        if self.image_widths is not None:
+            self.probe_rows(first)
+        if first < len(self.lines):
+            self.merge_sort_orders(first)
+        if len(selected) > 0:
+            # new row ids are larger than existing ones, so arrays stay sorted.
+            rows = array('I', sorted(chain.from_iterable(selected)))
+            if self.selection != 'path':
+                self.path_rows.extend(rows)     # otherwise, it is path_indexes[path] itself
+            if self.filtered_rows is not self.path_rows:
+                rows = self.filter_indexes(rows)
+                self.filtered_rows.extend(rows)
+            if len(rows) > 0:
+                if self.sort_column is not None:
+                    # rows are inserted among existing ones, could be in current page.
+                    position = self.merge_sort_selected(rows)
+                    self.indexes = self.order_indexes(self.filtered_rows)
+                else:
+                    position = len(self.filtered_rows) - len(rows)
+        return new_paths, position
+
+    def match_row(self, i):
+        """ Returns True if row i matches all terms of current query. """
+        texts = self.lines[i]
+        for column, value, exact in self.query_terms:
+            if column >= len(texts) or not match_value(texts[column], value, exact):
+                return False
+        return True
+
+    def read_lazy(self, filename, sidecar=True, jobs=1):
+        """ Index csv file by record offsets, rows are parsed when requested.
+            the index is kept in sidecar file(<csv>.idx) for next launch. """
+        try:
+            lines = LazyLines(filename)
+        except OSError as e:
+            print(e)
+            sys.exit(1)
+        # (re-)initialize members
+        self.indexes = []
+        self.current_pos = 0
+        self.selected_path = None
+        self.lines = lines
+        self.sidecar = sidecar
+        self.path_indexes = lines.build_index(sidecar, jobs)
+        self.path_list = sorted(self.path_indexes.keys())
+        if len(self.path_list) <= 0:
+            print('csv file does not have valid lines: %s' % (filename), file=sys.stderr)
+            sys.exit(1)
+
     def columns(self):
         """ Returns number of columns of csv file. """
         if self.lines is None:
@@ -76,27 +329,349 @@ class ListModel:
         """ Returns image path-list. """
         return self.path_list
 
-    def change_path(self, path):
-        """ Change selected path of this instance. """
-        if path in self.path_list:
+    def get_trie(self):
+        """ Returns PathTrie of image paths with row counts. """
+        if self.trie is None:
+            self.trie = PathTrie(self.path_indexes)
+        return self.trie
+
+    def change_path(self, path, subtree=False):
+        """ Change selected path of this instance.
+            with subtree, rows of path and all paths under it are selected. """
+        if subtree:
+            node = self.get_trie().find(path)
+            if node is None:
+                return False
+            if len(node.children) == 0 and len(node.keys) == 1:
+                path = node.keys[0]
+                subtree = False     # leaf, same as path itself
+        elif path not in self.path_indexes:
+            return False
+        if subtree:
+            self.select(path, 'subtree', self.trie.subtree_rows(path, self.path_indexes))
+        else:
+            self.select(path, 'path', self.path_indexes[path])
+        return True
+
+    def change_prefix(self, prefix):
+        """ Select rows of all paths which start with prefix(i.e. 2023/05/1). """
+        start, end = prefix_range(self.path_list, prefix)
+        if start == end:
+            return False
+        runs = [self.path_indexes[path] for path in self.path_list[start:end]]
+        self.select(prefix, 'prefix', array('I', sorted(chain.from_iterable(runs))))
+        return True
+
+    def select(self, path, selection, rows):
+        """ Set selected rows, and narrow them by query. """
+        self.current_pos = 0
+        self.path_rows = rows
+        self.filtered_rows = self.filter_indexes(rows)
+        self.sort_mask = None
+        self.sort_selected = {}
+        self.indexes = self.order_indexes(self.filtered_rows)
+        self.selected_path = path
+        self.selection = selection
+
+    def set_sort(self, column, descending=False):
+        """ Order rows of selection by column(None for file order), values are compared as
+            numbers if they look like numbers. """
+        self.sort_column = column
+        self.sort_descending = descending
+        if self.selected_path is not None:
             self.current_pos = 0
-            self.indexes = self.path_indexes[path]
-            self.selected_path = path
-            return True
+            self.indexes = self.order_indexes(self.filtered_rows)
+
+    def order_indexes(self, indexes):
+        """ Returns row ids(filtered_rows) in order of sort column. """
+        if self.sort_column is None:
+            return indexes
+        rows = self.sort_selected.get(self.sort_column)
+        if rows is None:
+            rows = self.sort_selected[self.sort_column] = self.order_rows(indexes)
+        if self.sort_descending:
+            rows = rows[::-1]
+        return rows
+
+    def order_rows(self, indexes):
+        """ Returns indexes(sorted row ids) ordered by sort column ascending. """
+        order = self.get_sort_order(self.sort_column)
+        if len(indexes) == len(order):
+            rows = order        # all rows are selected
+        elif use_mask(len(indexes), len(order)):
+            if self.sort_mask is None:
+                self.sort_mask = selection_mask(indexes, len(order))
+            rows = filter_order(order, self.sort_mask)
         else:
+            ranks = self.sort_ranks.get(self.sort_column)
+            if ranks is None:
+                ranks = self.sort_ranks[self.sort_column] = rank_order(order)
+            rows = array('I', sorted(indexes, key=ranks.__getitem__))
+        return rows
+
+    def merge_sort_orders(self, first):
+        """ Merge new row ids(from first) into cached sort orders of all rows. """
+        with stage('sort'):
+            rows = range(first, len(self.lines))
+            for column, order in self.sort_orders.items():
+                self.sort_orders[column] = merge_order(order, rows, row_key(self.lines, column))[0]
+            # positions of existing rows are shifted, ranks are computed again when required.
+            self.sort_ranks = {}
+            if self.sort_mask is not None:
+                self.sort_mask.extend(bytes(len(self.lines) - len(self.sort_mask)))
+
+    def merge_sort_selected(self, rows):
+        """ Merge new filtered row ids into cached sort orders of selection.
+            Returns lowest position of them in order of sort column and direction. """
+        position = 0    # order of sort column is computed again
+        for column, selected in self.sort_selected.items():
+            merged, first, last = merge_order(selected, rows, row_key(self.lines, column))
+            self.sort_selected[column] = merged
+            if column == self.sort_column:
+                position = len(merged) - 1 - last if self.sort_descending else first
+        if self.sort_mask is not None:
+            for row in rows:
+                self.sort_mask[row] = 1
+        return position
+
+    def get_sort_order(self, column):
+        """ Returns all row ids ordered by column ascending, computed once for each column. """
+        order = self.sort_orders.get(column)
+        if order is None:
+            with stage('sort'):
+                order = self.sort_orders[column] = column_order(self.lines, column)
+        return order
+
+    def selection_contains(self, path):
+        """ Returns True if rows of path are in current selection. """
+        if self.selected_path is None:
             return False
+        if self.selection == 'subtree':
+            return self.trie.contains(self.selected_path, path)
+        if self.selection == 'prefix':
+            return path.startswith(self.selected_path)
+        return path == self.selected_path
+
+    def filter_indexes(self, indexes):
+        """ Returns indexes narrowed by current query. """
+        if self.query_rows is None:
+            return indexes
+        return intersect(indexes, self.query_rows)
+
+    def set_query(self, text, column_names=None):
+        """ Filter rows of selected path by query(i.e. label=star result~wav).
+            empty text clears filter. raises ValueError for invalid query. """
+        terms = parse_query(text, column_names)
+        if len(terms) == 0:
+            self.query_rows = None
+            self.query_terms = None
+        else:
+            self.query_rows = run_query(self.lines, terms)
+            self.query_terms = terms
+        if self.selected_path is not None:
+            self.select(self.selected_path, self.selection, self.path_rows)
 
     def get_imagesize(self):
         """ Retrieve image-size from first image file. """
+        info = self.get_imageinfo()
+        if info is not None:
+            return info[0]
+
+    def get_display_size(self):
+        """ Retrieve size first image is shown at without shrinking, within memory ceiling. """
+        info = self.get_imageinfo()
+        if info is not None:
+            return fit_size(info[0], info[1], self.max_image_bytes)
+
+    def get_imageinfo(self):
+        """ Retrieve (size, number of bands) of first readable image file, header is read only.
+            Returns None if no image file is readable. """
         for path in self.path_list:
             for i in range(len(self.path_indexes[path])):
-                if self.image_directory is None:
-                    filename = self.lines[self.path_indexes[path][i]][0]
-                else:
-                    filename = os.path.join(self.image_directory, self.lines[self.path_indexes[path][i]][0])
-                if os.path.exists(filename):
-                    image = Image.open(filename)
-                    return image.size
+                index = self.path_indexes[path][i]
+                if self.image_widths is not None and self.image_widths[index] == 0:
+                    continue    # probed already, not readable
+                filename = self.get_filename(index)
+                if self.image_widths is None and not self.image_exists(filename):
+                    continue
+                try:
+                    with Image.open(self.open_image(filename)) as image:
+                        return image.size, len(image.getbands())
+                except (OSError, ValueError, Image.DecompressionBombError):
+                    continue    # unreadable, try next one
+
+    def probe_images(self, workers=8):
+        """ Read image size of all rows from file headers, by workers threads.
+            with sidecar index of lazy backend, sizes are kept in it and only new rows are probed. """
+        self.probe_workers = workers
+        self.image_widths = array('H')
+        self.image_heights = array('H')
+        base = self.get_image_base().encode('utf-8')
+        if isinstance(self.lines, LazyLines) and self.sidecar:
+            extra = self.lines.extra
+            if bytes(extra.get(b'imagedir', b'')) == base and b'widths' in extra and b'heights' in extra:
+                rows = min(self.lines.extra_rows, len(self.lines),
+                           len(extra[b'widths']) // 2, len(extra[b'heights']) // 2)
+                self.image_widths.frombytes(extra[b'widths'][:rows * 2])
+                self.image_heights.frombytes(extra[b'heights'][:rows * 2])
+        if self.probe_rows(len(self.image_widths)) > 0 and isinstance(self.lines, LazyLines) and self.sidecar:
+            self.lines.write_sidecar(self.path_indexes, {b'imagedir': base, b'widths': self.image_widths,
+                                                         b'heights': self.image_heights})
+
+    def probe_rows(self, first):
+        """ Probe image size of rows from first, returns number of probed rows. """
+        filenames = []
+        for i in range(first, len(self.lines)):
+            filenames.append(self.get_filename(i) if len(self.lines[i]) > 0 else None)
+        if len(filenames) == 0:
+            return 0
+        widths, heights = probe_sizes(filenames, self.open_image, self.probe_workers)
+        self.image_widths.extend(widths)
+        self.image_heights.extend(heights)
+        self.summary = None
+        return len(filenames)
+
+    def get_image_base(self):
+        """ Returns real path of image directory(or archive), sizes probed are valid for it. """
+        if self.source is not None:
+            return self.source.path
+        return os.path.realpath(self.image_directory if self.image_directory is not None else '.')
+
+    def get_size_summary(self):
+        """ Returns distribution of probed image sizes (see size_summary), or None. """
+        if self.image_widths is None:
+            return None
+        if self.summary is None:
+            self.summary = size_summary(self.image_widths, self.image_heights)
+        return self.summary
+
+    def image_exists(self, filename):
+        """ Returns True if image file(or archive member) exists. """
+        if self.source is not None:
+            return self.source.exists(filename)
+        return os.path.exists(filename)
+
+    def open_image(self, filename):
+        """ Returns file name, or file object of archive member, to be decoded. """
+        if self.source is not None:
+            return self.source.open(filename)
+        return filename
+
+    def get_filename(self, index):
+        """ Returns image file name(or archive member name) of specified line. """
+        if self.source is not None:
+            return normalize(self.lines[index][0])
+        if self.image_directory is None:
+            return self.lines[index][0]
+        return os.path.join(self.image_directory, self.lines[index][0])
+
+    def cached_image(self, filename, imagesize=None):
+        """ Returns image in thumbnail cache without reading file, or None. """
+        if self.cache is None:
+            return None
+        key = self.cache.make_key(filename, imagesize, (self.resample, self.reducing_gap), self.source)
+        if key is None:
+            return None
+        return self.cache.get(key)
+
+    def get_page_filenames(self, pos, indexes=None):
+        """ Returns image file names of one page from position. """
+        if indexes is None:
+            indexes = self.indexes
+        filenames = []
+        for i in range(pos, min(pos + self.display_rows, len(indexes))):
+            filenames.append(self.get_filename(indexes[i]))
+        return filenames
+
+    def load_image(self, filename, imagesize=None):
+        """ Read image file and shrink it, through thumbnail cache and store if any. """
+        image, key, store_key = self.find_image(filename, imagesize)
+        if image is not None:
+            return image
+        if self.use_engine(imagesize):
+            image = self.engine.submit(filename, imagesize).result()
+        else:
+            image = self.decode_image(filename, imagesize)
+        self.keep_image(image, key, store_key)
+        return image
+
+    def use_engine(self, imagesize):
+        """ Returns True if image of imagesize is decoded by engine, otherwise in this process. """
+        return self.engine is not None and self.engine.fits(imagesize) and self.engine.running()
+
+    def decode_image(self, filename, imagesize=None):
+        """ Decode image in this process, file object of archive member is closed after it. """
+        fp = self.open_image(filename)
+        try:
+            return decode_thumbnail(fp, imagesize, self.resample, self.reducing_gap,
+                                    self.max_image_bytes)
+        finally:
+            if fp is not filename:
+                fp.close()
+
+    def load_images(self, filenames, imagesize=None):
+        """ Read image files of one page, decoded in parallel by engine if any.
+            Images over memory ceiling are replaced with refused_image(), and
+            ones which could not be read with unreadable_image(). """
+        if not self.use_engine(imagesize):
+            images = []
+            for filename in filenames:
+                try:
+                    images.append(self.load_image(filename, imagesize))
+                except ImageTooLarge as e:
+                    print(e, file=sys.stderr)
+                    images.append(refused_image(e.size))
+                except OSError as e:
+                    print(e, file=sys.stderr)
+                    images.append(unreadable_image(imagesize))
+            return images
+        found = [self.find_image(filename, imagesize) for filename in filenames]
+        futures = []
+        for filename, (image, key, store_key) in zip(filenames, found):
+            if image is None:
+                futures.append(self.engine.submit(filename, imagesize))
+            else:
+                futures.append(None)
+        images = []
+        for future, (image, key, store_key) in zip(futures, found):
+            if future is not None:
+                try:
+                    image = future.result()
+                    self.keep_image(image, key, store_key)
+                except ImageTooLarge as e:
+                    print(e, file=sys.stderr)
+                    image = refused_image(e.size)
+                except OSError as e:
+                    print(e, file=sys.stderr)
+                    image = unreadable_image(imagesize)
+            images.append(image)
+        return images
+
+    def find_image(self, filename, imagesize=None):
+        """ Look up thumbnail cache and store. Returns (image or None, cache key, store key). """
+        variant = (self.resample, self.reducing_gap)
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(filename, imagesize, variant, self.source)
+            if key is not None:
+                image = self.cache.get(key)
+                if image is not None:
+                    return image, None, None
+        store_key = None
+        image = None
+        if self.store is not None and imagesize is not None:
+            store_key = self.store.make_key(filename, imagesize, variant, self.source)
+            image = self.store.get(store_key)
+            if image is not None:
+                self.keep_image(image, key, None)
+        return image, key, store_key
+
+    def keep_image(self, image, key, store_key):
+        """ Put decoded image into thumbnail store and cache. """
+        if store_key is not None:
+            self.store.put(store_key, image)
+        if key is not None:
+            self.cache.put(key, image)
 
     def get_imagerows(self, pos=-1, imagesize=None):
         """ Retrieve ListRow array with specified conditions in this instance."""
@@ -112,34 +687,48 @@ class ListModel:
             pos = self.current_pos
         rows = []
 
-        # read image file, then create ListRow instance with image and csv file line.
-        for i in range(pos, pos + self.display_rows):
-            if i >= len(self.indexes):
-                break
-            if self.image_directory is None:
-                filename = self.lines[self.indexes[i]][0]
-            else:
-                filename = os.path.join(self.image_directory, self.lines[self.indexes[i]][0])
-            image = Image.open(filename)
-            if imagesize is not None:
-                shrinked_image = image.resize(imagesize)
-                image = shrinked_image
+        # read image files, then create ListRow instance with image and csv file line.
+        images = self.load_images(self.get_page_filenames(pos), imagesize)
+        for i, image in zip(range(pos, pos + self.display_rows), images):
             row = ListRow(image, self.lines[self.indexes[i]])
             rows.append(row)
         return rows
 
+    def get_pagerows(self, pos=-1):
+        """ Retrieve ListRow array without images, those are decoded by caller later."""
+        if self.selected_path is None or len(self.indexes) == 0:
+            return None
+        if len(self.indexes) <= pos:
+            return None
+        if pos < 0:
+            pos = self.current_pos
+        rows = []
+        for i in range(pos, min(pos + self.display_rows, len(self.indexes))):
+            filename = self.get_filename(self.indexes[i])
+            rows.append(ListRow(None, self.lines[self.indexes[i]], filename))
+        return rows
+
     def get_position(self):
         """ Get position in selected self.indexes. """
         return self.current_pos
 
+    def set_position(self, pos):
+        """ Set position in selected self.indexes (i.e. top row of scrolled list). """
+        if self.indexes is None or len(self.indexes) == 0:
+            self.current_pos = 0
+        else:
+            self.current_pos = max(0, min(pos, len(self.indexes) - 1))
+
     def get_path_info(self):
         """ Make string for position display, like 0-9/50. """
         start = self.current_pos
         end = self.current_pos + self.display_rows - 1
-        total = len(self.path_indexes[self.selected_path])
+        total = len(self.indexes)
         if end >= total:
             end = total - 1
         path_info = 'Position: %d - %d / %d' % (start+1, end+1, total)
+        if self.query_rows is not None:
+            path_info += ' (filtered from %d)' % (len(self.path_rows))
         return path_info
 
     def forward(self):
@@ -171,7 +760,7 @@ class ListModel:
         if self.selected_path is None or len(self.indexes) == 0:
             # unable to get row text
             return retstr
-        current_indexes = self.path_indexes[self.selected_path]
+        current_indexes = self.indexes
         for selected_id in self.selected_ids:
             if len(retstr) > 0:
                 retstr = retstr + '\n'
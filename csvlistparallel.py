@@ -0,0 +1,156 @@
+""" Multi-core chunked csv parsing for csv file viewer application.
+
+File is split into byte chunks. Whether a chunk starts inside a quoted field
+is the parity of double quotes before it, so quotes are counted per chunk
+first. Then each chunk is parsed from its first record boundary in a
+process pool, and results are merged in original row order. Boundaries of
+neighbouring chunks are checked against each other, and None is returned
+when they do not match (i.e. quotes are not RFC 4180 style), so caller can
+fall back to serial parsing.
+"""
+
+import io
+import os
+import csv
+import mmap
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from csvlistlazy import scan_records
+from csvlisttree import index_rows
+
+MIN_CHUNK_BYTES = 1024 * 1024   # smaller files are not worth splitting
+CHUNKS_PER_JOB = 4
+
+def open_buffer(filename):
+    """ Returns (file, mmap) of whole file. """
+    f = open(filename, 'rb')
+    return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def count_quotes(filename, start, end):
+    """ Worker side: returns number of double quotes in [start, end). """
+    f, buf = open_buffer(filename)
+    try:
+        return buf[start:end].count(b'"')
+    finally:
+        buf.close()
+        f.close()
+
+def at_boundary(buf, pos):
+    """ Returns True if pos is just after line end(\\r\\n, \\r or \\n), or top of buf. """
+    if pos == 0:
+        return True
+    last = buf[pos - 1:pos]
+    return last == b'\n' or (last == b'\r' and buf[pos:pos + 1] != b'\n')
+
+def find_newline(buf, pos):
+    """ Returns (start, end) of first line end at or after pos, or (-1, -1) if none. """
+    newline = buf.find(b'\n', pos)
+    limit = newline if newline >= 0 else len(buf)
+    ret = buf.find(b'\r', pos, limit)
+    if ret < 0:
+        return newline, newline + 1 if newline >= 0 else -1
+    return ret, ret + 2 if ret + 1 == newline else ret + 1
+
+def find_boundary(buf, pos, in_quotes):
+    """ Returns first record start at or after pos, or len(buf) if none. """
+    if not in_quotes and at_boundary(buf, pos):
+        return pos
+    while True:
+        if in_quotes:
+            quote = buf.find(b'"', pos)
+            if quote < 0:
+                return len(buf)
+            in_quotes = False
+            pos = quote + 1
+            continue
+        newline, end = find_newline(buf, pos)
+        if newline < 0:
+            return len(buf)
+        quote = buf.find(b'"', pos, newline)
+        if quote < 0:
+            return end
+        in_quotes = True
+        pos = quote + 1
+
+def parse_chunk(filename, start, end, in_quotes, end_quotes, encoding, with_rows):
+    """ Worker side: parse records which start in [start, end).
+
+    in_quotes and end_quotes are quote states at start and end. Returns (first
+    record offset, offset after last record, offsets, path_indexes with
+    chunk-local row ids, rows or None), or None when rows could not be parsed
+    as RFC 4180 csv. With rows, records are only parsed by csv.reader, and
+    offsets is empty.
+    """
+    f, buf = open_buffer(filename)
+    try:
+        boundary = find_boundary(buf, start, in_quotes)
+        last_end = boundary
+        offsets = array('Q')
+        path_indexes = {}
+        rows = None
+        if not with_rows:
+            if boundary < end:
+                last_end, count = scan_records(buf, boundary, end, encoding, 0, offsets, path_indexes)
+            return boundary, last_end, offsets, path_indexes, rows
+        # records are parsed by csv.reader only. strict reader fails on quote
+        # states which differ from counted ones(i.e. data ends in quoted field).
+        if boundary < end:
+            last_end = find_boundary(buf, end, end_quotes)
+        text = buf[boundary:last_end].decode(encoding)
+        reader = csv.reader(io.StringIO(text, newline=None), delimiter=',', skipinitialspace=True,
+                            strict=True)
+        try:
+            rows = [tuple(row) for row in index_rows(reader, path_indexes)]
+        except csv.Error:
+            return None
+        return boundary, last_end, offsets, path_indexes, rows
+    finally:
+        buf.close()
+        f.close()
+
+def parallel_scan(filename, start, jobs, encoding, first_row=0, with_rows=False):
+    """ Parse records from start(a record boundary) to end of file with jobs processes.
+
+    Returns (end offset, offsets, path_indexes, rows or None), or None when
+    file is too small to split or chunk boundaries were inconsistent. offsets
+    are scanned only without rows.
+    """
+    size = os.path.getsize(filename)
+    if jobs <= 1 or size - start < MIN_CHUNK_BYTES * 2:
+        return None
+    nchunks = min(jobs * CHUNKS_PER_JOB, (size - start) // MIN_CHUNK_BYTES)
+    bounds = [start + (size - start) * i // nchunks for i in range(nchunks + 1)]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        counts = list(pool.map(count_quotes, [filename] * nchunks, bounds[:-1], bounds[1:]))
+        states = [False]
+        for count in counts[:-1]:
+            states.append(states[-1] ^ bool(count & 1))
+        results = list(pool.map(parse_chunk, [filename] * nchunks, bounds[:-1], bounds[1:],
+                                states, states[1:] + [False], [encoding] * nchunks,
+                                [with_rows] * nchunks))
+    if None in results:
+        return None
+    # each chunk must start exactly where records of previous chunk ended.
+    expected = start
+    for boundary, last_end, offsets, path_indexes, rows in results:
+        if boundary != expected:
+            return None
+        expected = last_end
+    if expected != size:
+        return None
+    # merge in original row order.
+    all_offsets = array('Q')
+    all_indexes = {}
+    all_rows = [] if with_rows else None
+    base = first_row
+    for boundary, last_end, offsets, path_indexes, rows in results:
+        all_offsets.extend(offsets)
+        for path, indexes in path_indexes.items():
+            merged = all_indexes.get(path)
+            if merged is None:
+                merged = all_indexes[path] = array('I')
+            merged.extend([i + base for i in indexes])
+        if with_rows:
+            all_rows.extend(rows)
+        base += len(rows) if with_rows else len(offsets)
+    return expected, all_offsets, all_indexes, all_rows
@@ -0,0 +1,119 @@
+""" Background prefetch of neighbouring pages for csv file viewer application. """
+
+import threading
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+class PrefetchScheduler:
+    def __init__(self, model, forward_pages = 2, backward_pages = 1, workers = 2):
+        """ Only instance variable initialization. """
+        self.model = model
+        self.forward_pages = forward_pages
+        self.backward_pages = backward_pages
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending = {}       # (filename, imagesize) -> Future
+        # re-entrant, since cancel() runs done-callbacks in calling thread.
+        self.lock = threading.RLock()
+        self.submitted = 0
+        self.cancelled = 0
+
+    def wanted_filenames(self):
+        """ Returns image file names of neighbouring pages, nearest first. """
+        model = self.model
+        if model.selected_path is None or len(model.indexes) == 0:
+            return []
+        rows = model.display_rows
+        positions = []
+        for k in range(1, self.forward_pages + 1):
+            positions.append(model.current_pos + rows * k)
+        for k in range(1, self.backward_pages + 1):
+            positions.append(model.current_pos - rows * k)
+        filenames = []
+        for pos in positions:
+            if 0 <= pos < len(model.indexes):
+                filenames.extend(model.get_page_filenames(pos))
+        # first page of neighbouring paths in combo-box
+        path_list = model.get_path_list()
+        i = bisect_left(path_list, model.selected_path)
+        if model.selection == 'path' and i < len(path_list) and path_list[i] == model.selected_path:
+            for j in (i + 1, i - 1):
+                if 0 <= j < len(path_list):
+                    indexes = model.path_indexes[path_list[j]]
+                    filenames.extend(model.get_page_filenames(0, indexes))
+        return filenames
+
+    def schedule(self, imagesize = None):
+        """ Submit decode jobs around current page, and cancel stale ones. """
+        if imagesize is not None:
+            imagesize = tuple(imagesize)
+        wanted = []
+        for filename in self.wanted_filenames():
+            wanted.append((filename, imagesize))
+        wanted_set = set(wanted)
+        with self.lock:
+            for key in list(self.pending.keys()):
+                if key not in wanted_set:
+                    self._cancel(key)
+            for key in wanted:
+                if key not in self.pending:
+                    future = self.executor.submit(self._load, key[0], key[1])
+                    self.pending[key] = future
+                    self.submitted += 1
+                    future.add_done_callback(self._done(key))
+
+    def wait_page(self, imagesize = None):
+        """ Wait for in-flight jobs of current page, so it is read from cache. """
+        if self.model.selected_path is None or len(self.model.indexes) == 0:
+            return
+        for filename in self.model.get_page_filenames(self.model.current_pos):
+            self.wait_file(filename, imagesize)
+
+    def wait_file(self, filename, imagesize = None):
+        """ Wait for in-flight job of one image file, if any. """
+        if imagesize is not None:
+            imagesize = tuple(imagesize)
+        with self.lock:
+            future = self.pending.get((filename, imagesize))
+        if future is None:
+            return
+        try:
+            future.result()
+        except (CancelledError, Exception):
+            # errors will be raised again by caller.
+            pass
+
+    def cancel(self):
+        """ Cancel all jobs which are not started yet. """
+        with self.lock:
+            for key in list(self.pending.keys()):
+                self._cancel(key)
+
+    def shutdown(self):
+        """ Stop worker threads. """
+        self.cancel()
+        self.executor.shutdown(wait=False)
+
+    def get_stats(self):
+        """ Returns counters as dictionary. """
+        with self.lock:
+            return {'submitted': self.submitted, 'cancelled': self.cancelled,
+                    'pending': len(self.pending)}
+
+    def _cancel(self, key):
+        """ Cancel one job (lock must be held). """
+        future = self.pending.pop(key)
+        if future.cancel():
+            self.cancelled += 1
+
+    def _load(self, filename, imagesize):
+        """ Worker side: decode image into model's thumbnail cache. """
+        self.model.load_image(filename, imagesize)
+
+    def _done(self, key):
+        """ Make callback to forget finished job. """
+        def inner(future):
+            nonlocal self
+            with self.lock:
+                if self.pending.get(key) is future:
+                    del self.pending[key]
+        return inner
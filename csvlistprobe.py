@@ -0,0 +1,65 @@
+""" Image size probe for csv file viewer application.
+
+Image.open() reads only the header of image file, so width and height of
+every row are known without decoding pixels. Files are probed by a thread
+pool, since it is dominated by file system latency (i.e. network mounted
+image directory) rather than by CPU. Sizes are kept as two array('H') of
+width and height indexed by row id, 0 for rows without readable image, and
+sides over 65535 pixels are clamped.
+"""
+
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+MAX_SIDE = 65535    # limit of array('H')
+CHUNK_ROWS = 256    # rows probed by one task
+
+def probe_size(opener, filename):
+    """ Returns (width, height) from header of image file, (0, 0) if it is not readable. """
+    if filename is None:
+        return 0, 0
+    try:
+        fp = opener(filename)
+    except OSError:
+        return 0, 0
+    try:
+        with Image.open(fp) as image:
+            return image.size
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return 0, 0
+    finally:
+        if fp is not filename:
+            fp.close()
+
+def probe_sizes(filenames, opener, workers=8):
+    """ Probe image files in parallel, opener returns file name or file object for name.
+        filenames could have None for rows without image. Returns (widths, heights) in order. """
+    def probe_chunk(chunk):
+        return [probe_size(opener, filename) for filename in chunk]
+    widths = array('H')
+    heights = array('H')
+    chunks = [filenames[i:i + CHUNK_ROWS] for i in range(0, len(filenames), CHUNK_ROWS)]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for sizes in executor.map(probe_chunk, chunks):
+            for width, height in sizes:
+                widths.append(min(width, MAX_SIDE))
+                heights.append(min(height, MAX_SIDE))
+    return widths, heights
+
+def size_summary(widths, heights):
+    """ Returns distribution of probed sizes as dictionary, or None if no image was probed.
+
+    count is number of probed images, width/height are (median, 95th percentile,
+    max) and aspect(width / height) is (5th, 50th, 95th percentile).
+    """
+    pairs = [(w, h) for w, h in zip(widths, heights) if w > 0 and h > 0]
+    if len(pairs) == 0:
+        return None
+    def percentiles(values, points):
+        ordered = sorted(values)
+        return tuple(ordered[min(len(ordered) - 1, int(len(ordered) * p))] for p in points)
+    return {'count': len(pairs), 'missing': len(widths) - len(pairs),
+            'width': percentiles([w for w, h in pairs], (0.5, 0.95, 1.0)),
+            'height': percentiles([h for w, h in pairs], (0.5, 0.95, 1.0)),
+            'aspect': percentiles([w / h for w, h in pairs], (0.05, 0.5, 0.95))}
@@ -0,0 +1,113 @@
+""" Per-stage latency instrumentation for csv file viewer application.
+
+Code is wrapped by stage(name) context manager:
+    with stage('resize'):
+        ...
+While profiling is disabled (default), stage() returns a shared no-op
+object, so only one function call is spent. enable() starts to keep
+latency of each stage, and trace events for write_trace() if requested.
+"""
+
+import sys
+import json
+import time
+import threading
+
+class NullStage:
+    """ No-op stage used while profiling is disabled. """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+class Stage:
+    def __init__(self, profiler, name):
+        """ Timer of one execution of stage. """
+        self.profiler = profiler
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+        return False
+
+class Profiler:
+    def __init__(self):
+        """ Disabled profiler. """
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.samples = {}       # stage name -> list of seconds
+        self.events = None      # trace events, None not to keep them
+        self.origin = time.perf_counter()
+        self.null_stage = NullStage()
+
+    def enable(self, trace=False):
+        """ Start to record latencies, and trace events if trace is True. """
+        with self.lock:
+            self.enabled = True
+            self.origin = time.perf_counter()
+            if trace:
+                self.events = []
+
+    def record(self, name, start, end):
+        """ Record one execution of stage, times are time.perf_counter(). """
+        with self.lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = []
+            samples.append(end - start)
+            if self.events is not None:
+                self.events.append({'name': name, 'ph': 'X', 'pid': 0,
+                                    'tid': threading.get_ident(),
+                                    'ts': (start - self.origin) * 1e6,
+                                    'dur': (end - start) * 1e6})
+
+    def get_stats(self):
+        """ Returns latency statistics of each stage in milliseconds. """
+        with self.lock:
+            items = [(name, sorted(samples)) for name, samples in self.samples.items()]
+        stats = {}
+        for name, ordered in items:
+            def percentile(p):
+                return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1e3
+            stats[name] = {'count': len(ordered), 'total': sum(ordered) * 1e3,
+                           'mean': sum(ordered) / len(ordered) * 1e3,
+                           'p50': percentile(0.5), 'p95': percentile(0.95),
+                           'p99': percentile(0.99), 'max': ordered[-1] * 1e3}
+        return stats
+
+    def report(self, counters=None, file=sys.stderr):
+        """ Print latency table, and counters ({name: {counter: value}}) if any. """
+        stats = self.get_stats()
+        print('%-12s %8s %10s %9s %9s %9s %9s %9s' % ('stage', 'count', 'total ms', 'mean',
+                                                    'p50', 'p95', 'p99', 'max'), file=file)
+        for name in sorted(stats.keys()):
+            s = stats[name]
+            print('%-12s %8d %10.1f %9.3f %9.3f %9.3f %9.3f %9.3f' % (
+                name, s['count'], s['total'], s['mean'], s['p50'], s['p95'], s['p99'], s['max']),
+                  file=file)
+        if counters is not None:
+            for name in sorted(counters.keys()):
+                values = ' '.join('%s=%s' % (k, v) for k, v in sorted(counters[name].items()))
+                print('%-12s %s' % (name, values), file=file)
+
+    def write_trace(self, filename):
+        """ Write trace events as Chrome trace format(chrome://tracing, Perfetto). """
+        with self.lock:
+            events = list(self.events) if self.events is not None else []
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+# profiler shared by all modules
+PROFILER = Profiler()
+
+def stage(name):
+    """ Returns context manager which measures stage name by shared profiler. """
+    if not PROFILER.enabled:
+        return PROFILER.null_stage
+    return Stage(PROFILER, name)
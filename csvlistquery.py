@@ -0,0 +1,130 @@
+""" Row filtering query for csv file viewer application.
+
+Query is space separated terms, all of them must match(conjunction):
+    name=value      column is exactly value
+    name~value      column contains value
+name is column name or 1-based column number. value can be quoted.
+Each term is evaluated to sorted row ids by backend(lines object), then
+intersected.
+"""
+
+import shlex
+from array import array
+from bisect import bisect_left, bisect_right
+
+def parse_query(text, column_names=None):
+    """ Parse query text into list of (column, value, exact), raises ValueError. """
+    try:
+        words = shlex.split(text)
+    except ValueError as e:
+        raise ValueError('invalid query: %s' % (e))
+    terms = []
+    for word in words:
+        exact_pos = word.find('=')
+        contain_pos = word.find('~')
+        if exact_pos < 0 and contain_pos < 0:
+            raise ValueError('invalid query term (must be name=value or name~value): %s' % (word))
+        if contain_pos < 0 or (0 <= exact_pos < contain_pos):
+            name, value, exact = word[:exact_pos], word[exact_pos + 1:], True
+        else:
+            name, value, exact = word[:contain_pos], word[contain_pos + 1:], False
+        terms.append((column_index(name, column_names), value, exact))
+    return terms
+
+def column_index(name, column_names=None):
+    """ Returns 0-based column of name or 1-based number, raises ValueError. """
+    if column_names is not None and name in column_names:
+        return list(column_names).index(name)
+    if name.isdigit() and int(name) >= 1:
+        return int(name) - 1
+    raise ValueError('unknown column: %s' % (name))
+
+def intersect(a, b):
+    """ Returns intersection of two sorted row id arrays. """
+    if len(a) > len(b):
+        a, b = b, a
+    result = array('I')
+    lo = 0
+    for x in a:
+        lo = bisect_left(b, x, lo)
+        if lo >= len(b):
+            break
+        if b[lo] == x:
+            result.append(x)
+    return result
+
+def match_value(text, value, exact):
+    """ Returns True if text matches term value. """
+    if exact:
+        return text == value
+    return value in text
+
+def scan_rows(lines, column, value, exact):
+    """ Find rows by checking every line, for backends without index. """
+    rows = array('I')
+    for i in range(len(lines)):
+        texts = lines[i]
+        if column < len(texts) and match_value(texts[column], value, exact):
+            rows.append(i)
+    return rows
+
+def scan_buffer(buf, offsets, value, exact, check=None, encoding='utf-8'):
+    """ Find rows whose byte range [offsets[i], offsets[i+1]) contains value.
+
+    buf is scanned with find(), so only rows containing encoded value are
+    visited. check(row) confirms a candidate row, or for exact match without
+    check, the whole range must equal value.
+    """
+    needle = value.encode(encoding, 'surrogatepass')
+    rows = array('I')
+    last = len(offsets) - 1
+    if len(needle) == 0:
+        # every row contains empty value, so check all of them.
+        for row in range(last):
+            if check is not None:
+                matched = check(row)
+            else:
+                matched = not exact or offsets[row] == offsets[row + 1]
+            if matched:
+                rows.append(row)
+        return rows
+    pos = 0
+    while True:
+        found = buf.find(needle, pos)
+        if found < 0:
+            break
+        row = bisect_right(offsets, found, 0, last) - 1
+        if row < 0:
+            pos = found + 1
+            continue
+        start, end = offsets[row], offsets[row + 1]
+        if found + len(needle) > end:
+            pos = found + 1     # straddles rows
+            continue
+        if check is not None:
+            matched = check(row)
+        elif exact:
+            matched = found == start and end - start == len(needle)
+        else:
+            matched = True
+        if matched:
+            rows.append(row)
+        if matched or check is not None:
+            pos = end       # whole row was checked
+        else:
+            pos = found + 1
+    return rows
+
+def run_query(lines, terms):
+    """ Returns sorted row ids which match all terms, or None for no terms. """
+    result = None
+    # evaluate exact terms first, they are usually narrower.
+    for column, value, exact in sorted(terms, key=lambda term: not term[2]):
+        if hasattr(lines, 'find_rows'):
+            rows = lines.find_rows(column, value, exact)
+        else:
+            rows = scan_rows(lines, column, value, exact)
+        result = rows if result is None else intersect(result, rows)
+        if len(result) == 0:
+            break
+    return result
@@ -0,0 +1,173 @@
+""" Sharded and compressed csv input for csv file viewer application.
+
+Manifest could be split into many shard files (i.e. part-*.csv.gz), which
+are read as one csv file: rows are numbered through shards in given order.
+Each shard is stream-decompressed and parsed by csv.reader, shards in a
+process pool with --jobs. Parsed rows of each shard are cached in a sidecar
+file(<shard>.rows), validated by size and mtime of the shard, so adding a
+shard to manifest costs parsing of that shard only.
+
+layout of sidecar (little-endian):
+    header      magic, version, marshal version, shard size, shard mtime
+    contents    marshal of (rows(list of tuples), {dirname: bytes of row ids('I')})
+"""
+
+import io
+import os
+import sys
+import csv
+import bz2
+import glob
+import gzip
+import lzma
+import struct
+import marshal
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from csvlisttree import index_rows
+
+try:
+    import zstandard
+except ImportError:     # optional, only for .zst shards
+    zstandard = None
+
+# errors of reading shards, other than OSError(gzip and bz2 raise it for corrupt data).
+READ_ERRORS = (OSError, EOFError, UnicodeDecodeError, csv.Error, lzma.LZMAError)
+if zstandard is not None:
+    READ_ERRORS += (zstandard.ZstdError,)
+
+MAGIC = b'CSVLROWS'
+VERSION = 2     # 2: newlines are translated as ListModel.read does
+HEADER = struct.Struct('<8sIIQq')
+COMPRESSED = ('.gz', '.bz2', '.xz', '.zst')
+
+def sidecar_name(filename):
+    """ Returns sidecar file name of shard. """
+    return filename + '.rows'
+
+def expand_inputs(patterns):
+    """ Returns file names of arguments, glob patterns are expanded in sorted order.
+        pattern without match is kept as is, to be reported when it is opened. """
+    filenames = []
+    for pattern in patterns:
+        if os.path.exists(pattern) or not glob.has_magic(pattern):
+            filenames.append(pattern)
+            continue
+        matches = sorted(name for name in glob.glob(pattern) if not name.endswith('.rows'))
+        if len(matches) == 0:
+            filenames.append(pattern)
+        filenames.extend(matches)
+    return filenames
+
+def is_compressed(filename):
+    """ Returns True if filename has suffix of compressed shard. """
+    return filename.endswith(COMPRESSED)
+
+def open_text(filename, encoding):
+    """ Open shard as text stream, decompressing it by suffix (raises OSError).
+        newlines are translated as csv file opened by ListModel.read is. """
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rt', encoding=encoding)
+    if filename.endswith('.bz2'):
+        return bz2.open(filename, 'rt', encoding=encoding)
+    if filename.endswith('.xz'):
+        return lzma.open(filename, 'rt', encoding=encoding)
+    if filename.endswith('.zst'):
+        if zstandard is None:
+            raise OSError('zstandard module is required to read: %s' % (filename))
+        f = open(filename, 'rb')
+        stream = zstandard.ZstdDecompressor().stream_reader(f, closefd=True)
+        return io.TextIOWrapper(stream, encoding=encoding)
+    return open(filename, 'r', encoding=encoding)
+
+def parse_shard(filename, encoding):
+    """ Parse shard, returns (rows, path_indexes with shard-local row ids). """
+    path_indexes = {}
+    with open_text(filename, encoding) as f:
+        reader = csv.reader(f, delimiter=',', skipinitialspace=True)
+        rows = [tuple(row) for row in index_rows(reader, path_indexes)]
+    return rows, path_indexes
+
+def cache_header(filename):
+    """ Returns header of sidecar for current shard file (raises OSError). """
+    st = os.stat(filename)
+    return HEADER.pack(MAGIC, VERSION, marshal.version, st.st_size, st.st_mtime_ns)
+
+def has_cache(filename):
+    """ Returns True if sidecar of shard is valid, only its header is read. """
+    try:
+        with open(sidecar_name(filename), 'rb') as f:
+            return f.read(HEADER.size) == cache_header(filename)
+    except OSError:
+        return False
+
+def read_cache(filename):
+    """ Load parsed shard from sidecar, returns None if it is missing or stale. """
+    try:
+        with open(sidecar_name(filename), 'rb') as f:
+            data = f.read()
+        if data[:HEADER.size] != cache_header(filename):
+            return None
+        # marshal.load() of file object reads it piecemeal, loads() of whole bytes is much faster.
+        rows, packed = marshal.loads(memoryview(data)[HEADER.size:])
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    path_indexes = {}
+    for path, ids in packed.items():
+        path_indexes[path] = array('I')
+        path_indexes[path].frombytes(ids)
+    return rows, path_indexes
+
+def write_cache(filename, rows, path_indexes):
+    """ Write parsed shard to sidecar, returns False on error. """
+    packed = {path: indexes.tobytes() for path, indexes in path_indexes.items()}
+    tmpname = sidecar_name(filename) + '.tmp'
+    try:
+        with open(tmpname, 'wb') as f:
+            f.write(cache_header(filename))
+            f.write(marshal.dumps((rows, packed)))
+        os.replace(tmpname, sidecar_name(filename))
+    except (OSError, ValueError) as e:
+        print('unable to write shard cache: %s (%s)' % (sidecar_name(filename), e), file=sys.stderr)
+        return False
+    return True
+
+def load_shard(filename, encoding, cache=True):
+    """ Worker side: parse shard and write its sidecar if cache is True. """
+    rows, path_indexes = parse_shard(filename, encoding)
+    if cache:
+        write_cache(filename, rows, path_indexes)
+    return rows, path_indexes
+
+def read_shards(filenames, encoding, jobs=1, cache=True):
+    """ Yields (first row id, rows, path_indexes with global row ids) of shards in order.
+        Cached shards are loaded in this process, others are parsed by jobs processes. """
+    cached = [cache and has_cache(filename) for filename in filenames]
+    executor = None
+    futures = {}
+    if jobs > 1 and cached.count(False) > 1:
+        executor = ProcessPoolExecutor(max_workers=jobs)
+        for i, filename in enumerate(filenames):
+            if not cached[i]:
+                futures[i] = executor.submit(load_shard, filename, encoding, cache)
+    try:
+        first = 0
+        for i, filename in enumerate(filenames):
+            result = read_cache(filename) if cached[i] else None
+            if result is not None:
+                rows, path_indexes = result
+            elif i in futures:
+                rows, path_indexes = futures.pop(i).result()
+            else:
+                # not cached, or sidecar was replaced after it was checked.
+                rows, path_indexes = load_shard(filename, encoding, cache)
+            if first > 0:
+                for path in path_indexes.keys():
+                    path_indexes[path] = array('I', [row + first for row in path_indexes[path]])
+            yield first, rows, path_indexes
+            first += len(rows)
+    finally:
+        if executor is not None:
+            for future in futures.values():
+                future.cancel()
+            executor.shutdown()
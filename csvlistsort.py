@@ -0,0 +1,88 @@
+""" Column sort orders for csv file viewer application.
+
+Sort order of a column is a permutation of all row ids, computed once and
+cached by the model. Values which look like numbers are compared as numbers
+and come before other texts. Dictionary-encoded columns sort only their
+distinct values, and the permutation is concatenated from postings of the
+inverted index without comparing rows.
+
+Selected rows are put in sort order either by walking the permutation with
+a mask of selected rows (large selection), or by sorting them with rank of
+each row in the permutation (small selection). Rows appended to followed file
+are merged into cached orders instead of sorting all rows again.
+"""
+
+import math
+from array import array
+from itertools import compress
+
+def value_key(text):
+    """ Returns numeric-aware sort key of text. """
+    try:
+        number = float(text)
+    except ValueError:
+        return (1, 0.0, text)
+    if number != number:
+        return (1, 0.0, text)     # nan
+    return (0, number, text)
+
+def row_key(lines, column):
+    """ Returns function of row id to sort key of its column. """
+    def key(row):
+        texts = lines[row]
+        return value_key(texts[column] if column < len(texts) else '')
+    return key
+
+def column_order(lines, column):
+    """ Returns array('I') of all row ids ordered by column ascending (stable). """
+    if hasattr(lines, 'column_order'):
+        return lines.column_order(column, value_key)
+    return array('I', sorted(range(len(lines)), key=row_key(lines, column)))
+
+def merge_order(order, rows, key):
+    """ Returns (array('I') of order with rows merged by key, position of first merged row,
+        position of last merged row). rows are larger than row ids of order, so they come
+        after equal keys. Each row is placed by binary search, keys of rows in order are
+        computed only on its search path. Positions are None if rows is empty. """
+    merged = array('I')
+    first = None
+    last = 0
+    for row in sorted(rows, key=key):
+        value = key(row)
+        low, high = last, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            if value < key(order[middle]):
+                high = middle
+            else:
+                low = middle + 1
+        merged.extend(order[last:low])
+        merged.append(row)
+        if first is None:
+            first = len(merged) - 1
+        last = low
+    position = len(merged) - 1 if first is not None else None
+    merged.extend(order[last:])
+    return merged, first, position
+
+def rank_order(order):
+    """ Returns array('I') of position of each row id in order. """
+    ranks = array('I', bytes(4 * len(order)))
+    for position, row in enumerate(order):
+        ranks[row] = position
+    return ranks
+
+def selection_mask(indexes, rows):
+    """ Returns bytearray of rows with 1 for row ids in indexes. """
+    mask = bytearray(rows)
+    for row in indexes:
+        mask[row] = 1
+    return mask
+
+def filter_order(order, mask):
+    """ Returns row ids of order which are set in mask, keeping order. """
+    return array('I', compress(order, map(mask.__getitem__, order)))
+
+def use_mask(selected, rows):
+    """ Returns True if selected rows of all rows are ordered faster by mask than by ranks. """
+    return selected * math.log2(max(2, selected)) > rows
@@ -0,0 +1,225 @@
+""" Persistent thumbnail store for csv file viewer application.
+
+Thumbnails are kept as raw pixels in append-only shard files, which are
+read through mmap, so no image decoding is needed to load them. The index
+is a sqlite database. Index rows are committed in batches, each after the
+shard has been synced, so a crash mid-write only leaves unreferenced bytes
+at the tail of a shard.
+"""
+
+import os
+import mmap
+import time
+import sqlite3
+import threading
+from PIL import Image
+from csvlistcache import identities
+
+# pixel modes stored as they are, others are converted before storing.
+STORABLE_MODES = ('1', 'L', 'LA', 'RGB', 'RGBA')
+
+class ThumbnailStore:
+    def __init__(self, directory, capacity_bytes = 1024 * 1024 * 1024,
+                 shard_bytes = 64 * 1024 * 1024, batch = 64):
+        """ Open(or create) store directory. """
+        self.directory = directory
+        self.capacity_bytes = capacity_bytes
+        self.shard_bytes = min(shard_bytes, max(capacity_bytes // 8, 1))
+        self.batch = batch      # number of puts committed at once
+        self.dirty = 0
+        self.lock = threading.RLock()
+        self.maps = {}          # shard number -> mmap
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, 'index.sqlite3'),
+                                  check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS thumbs ('
+                        'path TEXT, size INTEGER, mtime INTEGER, target TEXT, variant TEXT, '
+                        'shard INTEGER, offset INTEGER, length INTEGER, '
+                        'mode TEXT, width INTEGER, height INTEGER, '
+                        'PRIMARY KEY (path, size, mtime, target, variant))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS thumbs_shard ON thumbs (shard)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS shards ('
+                        'shard INTEGER PRIMARY KEY, last_used REAL)')
+        self.db.commit()
+        self.last_used = {}     # shard number -> time, flushed on commit
+        row = self.db.execute('SELECT MAX(shard) FROM shards').fetchone()
+        self.current_shard = row[0] if row[0] is not None else 0
+        if row[0] is None:
+            self.add_shard(self.current_shard)
+        self.total = self.total_bytes()
+
+    def shard_path(self, shard):
+        """ Returns file path of shard. """
+        return os.path.join(self.directory, 'shard-%06d.bin' % (shard))
+
+    def add_shard(self, shard):
+        """ Register new empty shard. """
+        open(self.shard_path(shard), 'ab').close()
+        self.db.execute('INSERT OR REPLACE INTO shards VALUES (?, ?)', (shard, time.time()))
+        self.db.commit()
+
+    @staticmethod
+    def make_key(filename, imagesize, variant=None, source=None):
+        """ Make key of (resolved path, file size, mtime, target size, variant).
+            filename is member name if source(ArchiveSource) is given. """
+        target = '%dx%d' % (imagesize[0], imagesize[1])
+        if source is not None:
+            identity = source.stat(filename)
+            if identity is None:
+                return None
+            path, size, mtime = identity
+            return (path, size, mtime, target, repr(variant))
+        identity = identities.get(filename)
+        if identity is None:
+            return None
+        path, size, mtime = identity
+        return (path, size, mtime, target, repr(variant))
+
+    def contains(self, key):
+        """ Returns True if thumbnail for key is stored, without reading it. """
+        if key is None:
+            return False
+        with self.lock:
+            row = self.db.execute('SELECT 1 FROM thumbs '
+                                  'WHERE path=? AND size=? AND mtime=? AND target=? AND variant=?',
+                                  key).fetchone()
+            return row is not None
+
+    def get(self, key):
+        """ Returns stored thumbnail(PIL.Image) for key, or None. """
+        if key is None:
+            return None
+        with self.lock:
+            row = self.db.execute('SELECT shard, offset, length, mode, width, height FROM thumbs '
+                                  'WHERE path=? AND size=? AND mtime=? AND target=? AND variant=?',
+                                  key).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            shard, offset, length, mode, width, height = row
+            buf = self.map_shard(shard, offset + length)
+            if buf is None:
+                self.misses += 1
+                return None
+            with memoryview(buf) as view:
+                image = Image.frombytes(mode, (width, height), view[offset:offset + length])
+            self.last_used[shard] = time.time()
+            self.hits += 1
+            return image
+
+    def map_shard(self, shard, end):
+        """ Returns mmap of shard which covers bytes until end. """
+        buf = self.maps.get(shard)
+        if buf is not None and len(buf) >= end:
+            return buf
+        if buf is not None:
+            buf.close()
+            del self.maps[shard]
+        try:
+            with open(self.shard_path(shard), 'rb') as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if len(buf) < end:
+            buf.close()
+            return None
+        self.maps[shard] = buf
+        return buf
+
+    def put(self, key, image):
+        """ Store thumbnail for key, then evicts old shards over capacity. """
+        if key is None:
+            return False
+        if image.mode not in STORABLE_MODES:
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode == 'PA' else 'RGB')
+        data = image.tobytes()
+        with self.lock:
+            path = self.shard_path(self.current_shard)
+            with open(path, 'ab') as f:
+                offset = f.tell()
+                f.write(data)
+            self.db.execute('INSERT OR REPLACE INTO thumbs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            key + (self.current_shard, offset, len(data),
+                                   image.mode, image.size[0], image.size[1]))
+            self.last_used[self.current_shard] = time.time()
+            self.total += len(data)
+            self.dirty += 1
+            if self.dirty >= self.batch:
+                self.commit()
+            if offset + len(data) >= self.shard_bytes:
+                self.commit()
+                self.current_shard += 1
+                self.add_shard(self.current_shard)
+            if self.total > self.capacity_bytes:
+                self.evict()
+        return True
+
+    def commit(self):
+        """ Sync current shard, then commit index rows and shard usage times. """
+        if self.dirty > 0:
+            # index rows are committed only after their pixels are on disk.
+            with open(self.shard_path(self.current_shard), 'ab') as f:
+                os.fsync(f.fileno())
+            self.dirty = 0
+        for shard, last_used in self.last_used.items():
+            self.db.execute('UPDATE shards SET last_used=? WHERE shard=?', (last_used, shard))
+        self.last_used = {}
+        self.db.commit()
+
+    def total_bytes(self):
+        """ Returns total size of shard files. """
+        total = 0
+        for (shard,) in self.db.execute('SELECT shard FROM shards'):
+            try:
+                total += os.path.getsize(self.shard_path(shard))
+            except OSError:
+                pass
+        return total
+
+    def evict(self):
+        """ Remove least recently used shards until total size fits capacity. """
+        self.commit()
+        while self.total > self.capacity_bytes:
+            row = self.db.execute('SELECT shard FROM shards WHERE shard<>? '
+                                  'ORDER BY last_used LIMIT 1', (self.current_shard,)).fetchone()
+            if row is None:
+                break
+            shard = row[0]
+            path = self.shard_path(shard)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            # forget index first, so a crash never leaves rows without pixels.
+            # usage times of other shards were flushed by commit() above.
+            self.db.execute('DELETE FROM thumbs WHERE shard=?', (shard,))
+            self.db.execute('DELETE FROM shards WHERE shard=?', (shard,))
+            self.db.commit()
+            buf = self.maps.pop(shard, None)
+            if buf is not None:
+                buf.close()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.total -= size
+            self.evictions += 1
+
+    def close(self):
+        """ Commit pending usage times and release mmaps. """
+        with self.lock:
+            self.commit()
+            for buf in self.maps.values():
+                buf.close()
+            self.maps = {}
+            self.db.close()
+
+    def get_stats(self):
+        """ Returns counters as dictionary. """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions}
@@ -0,0 +1,135 @@
+""" Directory tree of image paths for csv file viewer application.
+
+Image paths(directory of first column) are split by '/' into a prefix
+trie. Each node keeps number of rows of its own path and of its whole
+subtree, so navigator can show them without visiting descendants.
+Children are sorted only when they are requested. Paths which differ only
+by empty components(i.e. 'a//b' and 'a/b/') share one node, which keeps
+all of them as keys of path_indexes.
+"""
+
+import os
+from array import array
+from bisect import bisect_left
+from itertools import chain
+
+SEPARATOR = '/'
+
+def index_rows(rows, path_indexes, first_row=0):
+    """ Yields rows(from csv.reader) as they are, adding their row ids from first_row
+        grouped by directory of first field to path_indexes(path -> array('I')).
+        Every reader of csv rows(eager, parallel, follow, shards) groups them by this. """
+    dirname = os.path.dirname
+    for i, row in enumerate(rows, first_row):
+        if len(row) > 0:
+            path = dirname(row[0])
+            indexes = path_indexes.get(path)
+            if indexes is None:
+                path_indexes[path] = indexes = array('I')
+            indexes.append(i)
+        yield row
+
+class PathNode:
+    __slots__ = ('name', 'path', 'keys', 'parent', 'children', 'names', 'count', 'total')
+
+    def __init__(self, name, path, parent=None):
+        """ Node of one directory, without rows. """
+        self.name = name
+        self.path = path        # '' for root
+        self.keys = []          # paths of path_indexes with rows at this node
+        self.parent = parent
+        self.children = {}      # name -> PathNode
+        self.names = None       # sorted child names, None until requested
+        self.count = 0          # rows of this path itself
+        self.total = 0          # rows of this path and all descendants
+
+    def sorted_children(self):
+        """ Returns child nodes sorted by name. """
+        if self.names is None:
+            self.names = sorted(self.children.keys())
+        return [self.children[name] for name in self.names]
+
+    def child_index(self, name):
+        """ Returns position of child name among sorted children. """
+        if self.names is None:
+            self.names = sorted(self.children.keys())
+        return bisect_left(self.names, name)
+
+class PathTrie:
+    def __init__(self, path_indexes=None):
+        """ Build trie of paths, path_indexes is path -> row ids. """
+        self.root = PathNode('', '')
+        if path_indexes is not None:
+            for path, indexes in path_indexes.items():
+                self.add(path, len(indexes))
+
+    @staticmethod
+    def split(path):
+        """ Returns directory names of path, [] for root. absolute path starts with '/'. """
+        names = [name for name in path.split(SEPARATOR) if name != '']
+        if path.startswith(SEPARATOR):
+            names.insert(0, SEPARATOR)
+        return names
+
+    def add(self, path, count):
+        """ Add count rows to path, creating nodes on the way. Returns node of path. """
+        node = self.root
+        node.total += count
+        for name in self.split(path):
+            child = node.children.get(name)
+            if child is None:
+                child = node.children[name] = PathNode(name, join(node.path, name), node)
+                node.names = None
+            child.total += count
+            node = child
+        node.count += count
+        if path not in node.keys:
+            node.keys.append(path)
+        return node
+
+    def find(self, path):
+        """ Returns node of path, or None. """
+        node = self.root
+        for name in self.split(path):
+            node = node.children.get(name)
+            if node is None:
+                return None
+        return node
+
+    def paths_under(self, path):
+        """ Yields paths(keys of path_indexes) which have rows in subtree of path. """
+        node = self.find(path)
+        if node is None:
+            return
+        stack = [node]
+        while len(stack) > 0:
+            node = stack.pop()
+            yield from node.keys
+            stack.extend(node.children.values())
+
+    def subtree_rows(self, path, path_indexes):
+        """ Returns sorted row ids of all paths in subtree of path. """
+        runs = [path_indexes[p] for p in self.paths_under(path)]
+        # each run is sorted already, so sort() only merges them.
+        return array('I', sorted(chain.from_iterable(runs)))
+
+    def contains(self, path, descendant):
+        """ Returns True if descendant is path or under it. """
+        if path == '' or descendant == path:
+            return True
+        names = self.split(path)
+        return self.split(descendant)[:len(names)] == names
+
+def join(path, name):
+    """ Returns path of child name under path. """
+    if path == '':
+        return name
+    if path.endswith(SEPARATOR):
+        return path + name
+    return path + SEPARATOR + name
+
+def prefix_range(path_list, prefix):
+    """ Returns (start, end) of paths starting with prefix in sorted path_list. """
+    start = bisect_left(path_list, prefix)
+    end = bisect_left(path_list, prefix + '\U0010ffff', start)
+    return start, end
@@ -1,21 +1,34 @@
 """ View for csv file viewer application. """
 
 import os
+import queue
 import tkinter as tk
 from tkinter import ttk
 from PIL import Image, ImageTk, ImageDraw
+from csvlistprofile import stage
+
+MAX_NAVIGATOR_CHILDREN = 1000   # items inserted at once under one directory of navigator
 
 """ Utility class to have one line contents of cvs file. """
 class ListRow:
-    def __init__(self, image, texts):
-        """ set instance variables """
-        self.image = image.copy()
+    def __init__(self, image, texts, filename=None):
+        """ set instance variables (image could be None until it is decoded)
+            image is not copied, it could be shared with thumbnail cache and must not be modified. """
+        self.image = image
         self.photoimage = None
         self.texts = tuple(texts)
+        self.filename = filename
+
+    def set_image(self, image):
+        """ set decoded image(PIL.Image) later """
+        self.image = image
+        self.photoimage = None
 
     def get_image(self, root):
-        """ convert image(PIL.Image) to photoimage(PIL.ImageTK) """
-        self.photoimage = ImageTk.PhotoImage(self.image, master=root)
+        """ convert image(PIL.Image) to photoimage(PIL.ImageTK), then release image """
+        with stage('photoimage'):
+            self.photoimage = ImageTk.PhotoImage(self.image, master=root)
+        self.image = None       # pixels are kept by Tk
         return self.photoimage
 
     def get_texts(self):
@@ -38,6 +51,24 @@ class ListView(tk.Frame):
             root.geometry(geomstr)
         self.root = root
         self.app = app
+        self.rows = None
+        self.fill_generation = 0    # incremented on every fill, to drop stale images
+        self.image_queue = queue.Queue()
+        self.polling = False
+        self.placeholder = None
+        # virtual list mode: fixed pool of items(slots) recycled on scroll.
+        self.virtual = app.is_virtual()
+        self.virtual_top = 0
+        self.virtual_total = 0
+        self.virtual_epoch = None
+        self.virtual_rows = 0       # number of item slots
+        self.slot_photos = []       # recycled photoimage of each slot
+        self.scroll_pending = None
+        # directory navigator: tree items are inserted when parent is opened.
+        self.navigator_mode = app.get_navigator()
+        self.navigator_trie = None
+        self.navigator_items = set()    # paths of inserted items
+        self.navigator_loaded = set()   # paths whose children are inserted
         self.pack()
         self.build_widgets()
 
@@ -73,16 +104,31 @@ efj+BTjfeAQWaCAOIQAAOw=="""
 
         self.header.pack(side="top", fill="both", expand=False)
         self.footer.pack(side="bottom", fill="both", expand=False)
+        if self.navigator_mode == 'tree':
+            self.build_navigator()
         self.container.pack(side="left", fill="both", expand=True)
 
         # build widgets for header
         self.title_label = tk.Label(master=self.header, text = "Image Path:",
                                     bg=self.header["bg"])
         self.title_label.pack(side="left")
-        ## dropdown-list
-        self.combobox = ttk.Combobox(master=self.header, style="office.TCombobox")
-        self.combobox.bind('<<ComboboxSelected>>' , self.app.combo_selected(self.combobox))
-        self.combobox.pack(pady=2, side="left")
+        if self.navigator_mode == 'tree':
+            ## path prefix entry for navigator
+            self.path_entry = tk.Entry(master=self.header, width=30)
+            self.path_entry.bind('<Return>', self.app.prefix_entered(self.path_entry))
+            self.path_entry.pack(pady=2, side="left")
+        else:
+            ## dropdown-list
+            self.combobox = ttk.Combobox(master=self.header, style="office.TCombobox")
+            self.combobox.bind('<<ComboboxSelected>>' , self.app.combo_selected(self.combobox))
+            self.combobox.pack(pady=2, side="left")
+        ## query entry
+        self.query_label = tk.Label(master=self.header, text = "Filter:",
+                                    bg=self.header["bg"])
+        self.query_label.pack(side="left")
+        self.query_entry = tk.Entry(master=self.header, width=30)
+        self.query_entry.bind('<Return>', self.app.query_entered(self.query_entry))
+        self.query_entry.pack(pady=2, side="left")
 
         # build widgets for footer, and set event handler for button.
         self.backward_cmd = tk.Button(self.footer, text = "<<backward", width=16,
@@ -116,21 +162,157 @@ efj+BTjfeAQWaCAOIQAAOw=="""
         self.treeview.column('#0',anchor='w', stretch=0, width=imagecolumnwidth)
         for item in column_ids:
             self.treeview.column(item, anchor='w') #, width=80)
-        # set label of columns
+        # set label of columns, click on it sorts rows by the column.
         self.treeview.heading('#0',text='image', anchor='center')
+        self.column_ids = column_ids
+        self.column_labels = list(columns)
         for i,item in enumerate(column_ids):
-            self.treeview.heading(item, text=columns[i], anchor='w')
+            self.treeview.heading(item, text=columns[i], anchor='w',
+                                  command=self.app.heading_clicked(i))
 
         # set vertial scroll-bar for treeview
-        self.vscroll = ttk.Scrollbar(self.container, command = self.treeview.yview, orient = tk.VERTICAL)
+        if self.virtual:
+            # scroll-bar covers all rows, not only items in treeview.
+            self.vscroll = ttk.Scrollbar(self.container, command = self.virtual_scrollbar, orient = tk.VERTICAL)
+            self.treeview.bind('<Configure>', self.virtual_configured)
+            self.treeview.bind('<MouseWheel>', self.virtual_wheel)
+            self.treeview.bind('<Button-4>', self.virtual_wheel)
+            self.treeview.bind('<Button-5>', self.virtual_wheel)
+            self.treeview.bind('<Prior>', lambda event: self.virtual_scrollbar('scroll', -1, 'pages'))
+            self.treeview.bind('<Next>', lambda event: self.virtual_scrollbar('scroll', 1, 'pages'))
+        else:
+            self.vscroll = ttk.Scrollbar(self.container, command = self.treeview.yview, orient = tk.VERTICAL)
+            self.treeview.configure(yscrollcommand = self.vscroll.set)
         self.vscroll.grid(row = 0, column = 1, sticky = tk.NS)
-        self.treeview.configure(yscrollcommand = self.vscroll.set)
         self.treeview.grid(row = 0, column = 0, sticky = tk.NSEW, rowspan=5)
 
         # set event listener for treeview
         self.treeview.bind('<<TreeviewSelect>>', self.app.treeview_row_selected(self.treeview))
         self.treeview.bind('<Control-Key-c>', self.app.treeview_ctrlc_pressed(self.treeview))
 
+    def build_navigator(self):
+        """ Build directory tree at left side of list. """
+        self.navigator_frame = tk.Frame(master=self.root)
+        self.navigator_frame.rowconfigure(0, weight=1)
+        self.navigator_frame.columnconfigure(0, weight=1)
+        self.navigator_frame.pack(side="left", fill="y", expand=False)
+        self.navigator = ttk.Treeview(master=self.navigator_frame, columns=('rows',),
+                                      show='tree headings', style='Navigator.Treeview')
+        ttk.Style().configure('Navigator.Treeview', rowheight=20)
+        self.navigator.heading('#0', text='path', anchor='w')
+        self.navigator.heading('rows', text='rows', anchor='e')
+        self.navigator.column('#0', anchor='w', width=200)
+        self.navigator.column('rows', anchor='e', stretch=0, width=70)
+        self.navigator_scroll = ttk.Scrollbar(self.navigator_frame, command=self.navigator.yview,
+                                              orient=tk.VERTICAL)
+        self.navigator.configure(yscrollcommand=self.navigator_scroll.set)
+        self.navigator.grid(row=0, column=0, sticky=tk.NSEW)
+        self.navigator_scroll.grid(row=0, column=1, sticky=tk.NS)
+        self.navigator.bind('<<TreeviewOpen>>', self.navigator_opened)
+        self.navigator.bind('<<TreeviewSelect>>', self.navigator_selected)
+
+    def fill_navigator(self, trie):
+        """ fill navigator with top level directories of trie(PathTrie). """
+        self.navigator_trie = trie
+        self.navigator.delete(*self.navigator.get_children())
+        self.navigator_items = set()
+        self.navigator_loaded = set()
+        if trie.root.count > 0:
+            # rows of files at top directory
+            self.navigator.insert('', 'end', iid='p:', text='./', values=(trie.root.count,))
+            self.navigator_items.add('')
+        self.insert_navigator_children(trie.root)
+
+    def insert_navigator_node(self, parent_iid, node, index='end'):
+        """ Insert item of node(PathNode), with dummy child if it has children. """
+        iid = 'p:' + node.path
+        self.navigator.insert(parent_iid, index, iid=iid, text=node.name, values=(node.total,))
+        self.navigator_items.add(node.path)
+        if len(node.children) > 0:
+            self.navigator.insert(iid, 'end', iid='d:' + node.path)
+
+    def insert_navigator_children(self, node):
+        """ Insert children of node, up to MAX_NAVIGATOR_CHILDREN. """
+        parent_iid = '' if node is self.navigator_trie.root else 'p:' + node.path
+        children = node.sorted_children()
+        for child in children[:MAX_NAVIGATOR_CHILDREN]:
+            self.insert_navigator_node(parent_iid, child)
+        if len(children) > MAX_NAVIGATOR_CHILDREN:
+            self.navigator.insert(parent_iid, 'end', iid='m:' + node.path,
+                                  text='... %d more (type path to filter)' % (len(children) - MAX_NAVIGATOR_CHILDREN))
+        self.navigator_loaded.add(node.path)
+
+    def navigator_opened(self, event):
+        """ Insert children of opened directory. """
+        iid = self.navigator.focus()
+        if not iid.startswith('p:'):
+            return
+        path = iid[2:]
+        if path in self.navigator_loaded:
+            return
+        self.navigator.delete('d:' + path)
+        node = self.navigator_trie.find(path)
+        if node is not None:
+            self.insert_navigator_children(node)
+
+    def navigator_selected(self, event):
+        """ Select rows of directory and all directories under it. """
+        selection = self.navigator.selection()
+        if len(selection) == 0 or not selection[0].startswith('p:'):
+            return
+        self.app.navigator_selected(selection[0][2:])
+
+    def show_navigator_matches(self, paths, total):
+        """ fill navigator with flat list of paths matched with prefix. """
+        trie = self.navigator_trie
+        self.navigator.delete(*self.navigator.get_children())
+        self.navigator_items = set()
+        self.navigator_loaded = set()
+        for path in paths:
+            node = trie.find(path)
+            self.navigator.insert('', 'end', iid='p:' + path, text=path, values=(node.count,))
+        if total > len(paths):
+            self.navigator.insert('', 'end', iid='m:', text='... %d more' % (total - len(paths)))
+
+    def update_navigator(self, new_paths):
+        """ Update row counts of inserted items, and insert new paths under opened directories. """
+        trie = self.navigator_trie
+        flat = len(self.navigator_loaded) == 0     # showing prefix matches
+        for path in self.navigator_items:
+            node = trie.find(path)
+            self.navigator.set('p:' + path, 'rows', node.count if path == '' or flat else node.total)
+        if flat:
+            return
+        for path in new_paths:
+            node = trie.root
+            for name in trie.split(path):
+                parent, node = node, node.children[name]
+                if node.path in self.navigator_items:
+                    continue
+                if parent.path not in self.navigator_loaded:
+                    parent_iid = 'p:' + parent.path
+                    if not self.navigator.exists('d:' + parent.path):
+                        self.navigator.insert(parent_iid, 'end', iid='d:' + parent.path)
+                    break
+                index = parent.child_index(name)
+                if index >= MAX_NAVIGATOR_CHILDREN:
+                    break
+                parent_iid = 'p:' + parent.path
+                if parent is trie.root:
+                    parent_iid = ''
+                    if '' in self.navigator_items:
+                        index += 1      # after item of top directory
+                self.insert_navigator_node(parent_iid, node, index)
+                break
+
+    def set_sort_indicator(self, column, descending):
+        """ Mark heading of sort column(None for file order) with arrow. """
+        for i, item in enumerate(self.column_ids):
+            text = self.column_labels[i]
+            if i == column:
+                text += ' \u25bc' if descending else ' \u25b2'
+            self.treeview.heading(item, text=text)
+
     def set_status_label(self, textval):
         """ Set text to status-label. """
         self.status_label.config(text = textval)
@@ -141,18 +323,190 @@ efj+BTjfeAQWaCAOIQAAOw=="""
         self.combobox['values'] = copied_items
         self.combobox.current(0)
 
-    def fill_treeview(self, rows):
-        """ fill treeview rows. """
-        # delete items
+    def update_combobox(self, items):
+        """ replace combo-box items, keeping selected item. """
+        self.combobox['values'] = list(items)
+
+    def clear_treeview(self):
+        """ delete items and release their images, before next page is decoded. """
         children = self.treeview.get_children()
         for item in children:
             self.treeview.delete(item)
+        self.rows = None
+
+    def fill_treeview(self, rows):
+        """ fill treeview rows. """
+        # delete items
+        self.clear_treeview()
         # insert items
+        if rows is None:
+            rows = []           # no rows matched
         self.rows = rows        # keep instance
         for i, row in enumerate(rows):
             idx = str(i)
             name = 'picture' + idx
-            self.treeview.insert("", 'end', iid=idx, values=row.get_texts(), image=row.get_image(self))
+            photoimage = row.get_image(self)
+            with stage('insert'):
+                self.treeview.insert("", 'end', iid=idx, values=row.get_texts(), image=photoimage)
+        self.fill_generation += 1
+
+    def get_placeholder(self, size):
+        """ Returns placeholder photoimage which is shown until image arrives. """
+        if self.placeholder is None or self.placeholder_size != size:
+            image = Image.new('RGB', size, 'lightgray')
+            self.placeholder = ImageTk.PhotoImage(image, master=self)
+            self.placeholder_size = size
+        return self.placeholder
+
+    def fill_treeview_progressive(self, rows, size):
+        """ fill treeview rows with texts and placeholder, images come later by post_image. """
+        children = self.treeview.get_children()
+        for item in children:
+            self.treeview.delete(item)
+        self.fill_generation += 1
+        if rows is None:
+            rows = []
+        self.rows = rows
+        placeholder = self.get_placeholder(size)
+        for i, row in enumerate(rows):
+            with stage('insert'):
+                self.treeview.insert("", 'end', iid=str(i), values=row.get_texts(), image=placeholder)
+        return self.fill_generation
+
+    def post_image(self, generation, i, image):
+        """ Queue decoded image for row i (could be called from any thread). """
+        self.image_queue.put((generation, i, image))
+
+    def start_polling(self):
+        """ Start polling queued images, it stops when no decode job is pending. """
+        if not self.polling:
+            self.polling = True
+            self.after(10, self.poll_images)
+
+    def poll_images(self):
+        """ Attach queued images to treeview items of current fill. """
+        # checked before draining, images of jobs finished by now are in queue.
+        pending = self.app.images_pending()
+        while True:
+            try:
+                generation, i, image = self.image_queue.get_nowait()
+            except queue.Empty:
+                break
+            if image is None:
+                continue    # failed to decode
+            if self.virtual:
+                self.attach_virtual_image(generation, i, image)
+                continue
+            if generation != self.fill_generation:
+                continue    # image of older page
+            row = self.rows[i]
+            row.set_image(image)
+            self.treeview.item(str(i), image=row.get_image(self))
+        if pending:
+            self.after(10, self.poll_images)
+        else:
+            self.polling = False
+
+    def virtual_configured(self, event):
+        """ Resize item pool to treeview height. """
+        rowheight = self.app.get_rowheight() or 40
+        rows = max(1, event.height // rowheight)
+        if rows != self.virtual_rows:
+            self.virtual_rows = rows
+            self.app.virtual_resized(rows)
+
+    def virtual_wheel(self, event):
+        """ Scroll by mouse wheel. """
+        if event.num == 4:
+            units = -1
+        elif event.num == 5:
+            units = 1
+        elif abs(event.delta) >= 120:
+            units = -event.delta // 120     # windows
+        else:
+            units = -event.delta            # macosx
+        self.virtual_scrollbar('scroll', units * 3, 'units')
+        return 'break'
+
+    def virtual_scrollbar(self, *args):
+        """ Scroll-bar command, moves top row. """
+        visible = max(1, self.virtual_rows)
+        if args[0] == 'moveto':
+            top = int(float(args[1]) * self.virtual_total)
+        elif args[2] == 'pages':
+            top = self.virtual_top + int(args[1]) * visible
+        else:
+            top = self.virtual_top + int(args[1])
+        top = max(0, min(top, self.virtual_total - visible))
+        if top == self.virtual_top:
+            return
+        self.virtual_top = top
+        # coalesce burst of scroll events into one refill.
+        if self.scroll_pending is None:
+            self.scroll_pending = self.after_idle(self.virtual_scrolled)
+
+    def virtual_scrolled(self):
+        """ Refill items after scrolling. """
+        self.scroll_pending = None
+        self.app.virtual_scrolled(self.virtual_top)
+
+    def fill_virtual(self, top, total, rows, size, epoch):
+        """ Fill item pool with rows from top, images not decoded yet come by post_image. """
+        if rows is None:
+            rows = []
+        self.virtual_top = top
+        self.virtual_total = total
+        self.virtual_epoch = epoch
+        self.rows = rows
+        # grow item pool, items are never deleted but detached.
+        while len(self.slot_photos) < len(rows):
+            self.treeview.insert("", 'end', iid=str(len(self.slot_photos)))
+            self.slot_photos.append(None)
+        placeholder = self.get_placeholder(size)
+        for i in range(len(self.slot_photos)):
+            iid = str(i)
+            if i >= len(rows):
+                self.treeview.detach(iid)
+                continue
+            self.treeview.move(iid, "", i)
+            row = rows[i]
+            if row.image is None:
+                photo = placeholder
+            else:
+                photo = self.set_slot_image(i, row.image)
+                row.image = None    # pasted into photoimage of slot
+            with stage('insert'):
+                self.treeview.item(iid, values=row.get_texts(), image=photo)
+        if total > 0:
+            self.vscroll.set(top / total, min(1.0, (top + max(1, self.virtual_rows)) / total))
+        else:
+            self.vscroll.set(0.0, 1.0)
+
+    def set_virtual_total(self, total):
+        """ Update number of all rows in virtual list, and scroll-bar for it. """
+        self.virtual_total = total
+        if total > 0:
+            top = self.virtual_top
+            self.vscroll.set(top / total, min(1.0, (top + max(1, self.virtual_rows)) / total))
+
+    def set_slot_image(self, slot, image):
+        """ Returns photoimage of slot with image, pasting into it if size is same. """
+        photo = self.slot_photos[slot]
+        if photo is not None and (photo.width(), photo.height()) == image.size:
+            with stage('photoimage'):
+                photo.paste(image)
+        else:
+            with stage('photoimage'):
+                photo = ImageTk.PhotoImage(image, master=self)
+            self.slot_photos[slot] = photo
+        return photo
+
+    def attach_virtual_image(self, epoch, position, image):
+        """ Attach decoded image of row position, if it is still in item pool. """
+        slot = position - self.virtual_top
+        if epoch != self.virtual_epoch or slot < 0 or slot >= len(self.rows):
+            return
+        self.treeview.item(str(slot), image=self.set_slot_image(slot, image))
 
     def fill_clipboard(self, text):
         if len(text) > 0: